@@ -0,0 +1,142 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from mtp import SimConfig
+from mtp2_final import EVENT_NAMES, Sim
+
+# Canonical scenarios with fixed seeds. Durations are kept short enough for routine use while
+# still covering several R periods and plenty of A-block reorgs.
+SCENARIOS = {
+    'small': {'N': 16, 'AC': 32, 'duration': 60, 'seed': 1},
+    'default': {'N': 128, 'AC': 32, 'duration': 20, 'seed': 1},
+    'large': {'N': 512, 'AC': 64, 'duration': 10, 'seed': 1},
+}
+
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+
+def run_scenario(params):
+    args = SimConfig(**params)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        args.output_dir = output_dir
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            sim = Sim(args)
+            sim.run()
+            wall_time = time.perf_counter() - start
+
+    events = sum(sim.event_counts)
+    return {
+        'params': params,
+        'wall_time': wall_time,
+        'events': events,
+        'events_per_sec': events / wall_time,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'event_counts': {EVENT_NAMES[event_type]: count for event_type, count in enumerate(sim.event_counts)
+                         if event_type in EVENT_NAMES},
+    }
+
+
+def run_isolated(params):
+    # A fresh interpreter per scenario so peak RSS is not inherited from earlier scenarios
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_scenario, params).result()
+
+
+def run_repeated(params, repeats):
+    # Wall time of a single run swings by 20-30% on a busy machine; the fastest of several runs
+    # is far more stable, and noise only ever makes a run slower
+    runs = [run_isolated(params) for _ in range(repeats)]
+    result = max(runs, key=lambda run: run['events_per_sec'])
+    result['repeats'] = repeats
+    result['median_events_per_sec'] = statistics.median(run['events_per_sec'] for run in runs)
+    return result
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if base.get('repeats', 1) != result['repeats']:
+            print('note: {name} baseline is the best of {base} runs, this is the best of {cur}'.format(
+                name=name, base=base.get('repeats', 1), cur=result['repeats']))
+        if result['events_per_sec'] < base['events_per_sec'] * (1 - threshold):
+            regressions.append('{name}: events/sec {cur:.0f} vs baseline {base:.0f}'.format(
+                name=name, cur=result['events_per_sec'], base=base['events_per_sec']))
+        if result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + threshold):
+            regressions.append('{name}: peak RSS {cur:.1f} MB vs baseline {base:.1f} MB'.format(
+                name=name, cur=result['peak_rss_mb'], base=base['peak_rss_mb']))
+        if result['events'] != base['events']:
+            print('note: {name} processed {cur} events vs {base} in the baseline (simulation behaviour changed)'.format(
+                name=name, cur=result['events'], base=base['events']))
+    return regressions
+
+
+def print_result(name, result, base=None):
+    line = '{name:<8} {wall:8.2f} s {eps:10.0f} events/s (median {median:.0f}) {rss:8.1f} MB  {events} events'.format(
+        name=name, wall=result['wall_time'], eps=result['events_per_sec'], median=result['median_events_per_sec'],
+        rss=result['peak_rss_mb'], events=result['events'])
+    if base is not None:
+        line += '  ({change:+.1%} events/s vs baseline)'.format(
+            change=result['events_per_sec'] / base['events_per_sec'] - 1)
+    print(line)
+    print('         ' + '  '.join('{name}={count}'.format(name=event_name, count=count)
+                                  for event_name, count in result['event_counts'].items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the simulator on canonical scenarios')
+    parser.add_argument('--scenarios', help='Scenarios to run', nargs='*', default=list(SCENARIOS),
+                        choices=list(SCENARIOS))
+    parser.add_argument('--baseline', help='Baseline JSON to compare against', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', help='Store these results as the new baseline', action='store_true')
+    parser.add_argument('--threshold', help='Allowed relative regression before failing', default=0.10, type=float)
+    parser.add_argument('--repeats', help='Runs per scenario; the fastest one is compared', default=3, type=int)
+    parser.add_argument('--output', help='Also write the results JSON to this file', default=None)
+
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    elif not args.save_baseline:
+        print('warning: baseline {path} does not exist; this run will fail'.format(path=args.baseline))
+
+    results = {}
+    for name in args.scenarios:
+        results[name] = run_repeated(SCENARIOS[name], args.repeats)
+        print_result(name, results[name], baseline.get(name))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print('baseline saved to ' + args.baseline)
+        sys.exit(0)
+
+    # A scenario without a baseline cannot pass: nothing was checked
+    missing = [name for name in results if name not in baseline]
+    for name in missing:
+        print('NO BASELINE {name} in {path} (record one with --save-baseline)'.format(name=name, path=args.baseline))
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    sys.exit(1 if regressions or missing else 0)
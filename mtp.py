@@ -0,0 +1,198 @@
+import argparse
+import os
+import sys
+from dataclasses import asdict, dataclass, fields, is_dataclass
+from typing import Optional
+
+# Lightweight front end of the simulator: configuration, command line and the sim_server.py client.
+# Only the standard library is imported here; the simulator (and NumPy) is imported once a run
+# actually starts, so --help, argument errors and runs submitted to a server start in milliseconds.
+
+LOG_LEVELS = {'off': 0, 'info': 1, 'debug': 2}
+GENERATORS = ['random', 'random_regular', 'erdos_renyi', 'scale_free', 'file']
+LATENCY_MODELS = ['uniform', 'geographic']
+
+# Config fields holding file system paths; made absolute before a config is sent to a server
+PATH_FIELDS = ['output_dir', 'results_db', 'trace', 'metrics_out', 'topology_file', 'topology_cache',
+               'checkpoint_dir']
+
+
+@dataclass
+class SimConfig:
+    # Everything a Sim is configured with. The command line defaults come from here, so
+    # SimConfig(N=64, seed=1) is the same run as --N 64 --seed 1.
+    N: int = 128
+    TBS: int = 1024
+    IAR: int = 600
+    AC: int = 32
+    IAA: int = 10
+    duration: int = 300
+    seed: Optional[int] = None
+    output_dir: str = '.'
+    results_db: Optional[str] = None
+    log_level: str = 'off'
+    trace: Optional[str] = None
+    metrics_window: int = 60
+    metrics_out: Optional[str] = None
+    gossip: str = 'flood'
+    links: str = 'independent'
+    txn_blocks: str = 'eager'
+    profile: bool = False
+    until_converged: bool = False
+    ci_target: float = 0.05
+    topology: str = 'random'
+    degree: int = 8
+    latency: str = 'uniform'
+    topology_file: Optional[str] = None
+    topology_cache: Optional[str] = None
+    finality_depth: int = 32
+    checkpoint_dir: Optional[str] = None
+    checkpoint_every: int = 30
+
+
+def config_from_args(args):
+    # Drops command line only options such as --resume or --replications
+    return SimConfig(**{field.name: getattr(args, field.name) for field in fields(SimConfig)})
+
+
+def check_config(parser, config):
+    # Invalid combinations are usage errors, reported before the simulator (and NumPy) is
+    # imported; Sim.configure repeats these checks for library callers
+    if config.gossip == 'fast' and config.links == 'contention':
+        parser.error('--links contention models hop-by-hop sends and cannot be used with --gossip fast')
+    if config.finality_depth < 0 or config.finality_depth == 1:
+        parser.error('--finality_depth must be 0 (no pruning) or at least 2')
+    if config.topology == 'file' and config.topology_file is None:
+        parser.error('--topology file needs --topology_file')
+
+
+def __getattr__(name):
+    # The simulator classes resolve lazily, e.g. mtp.Sim(mtp.SimConfig(N=16)).run()
+    if name in ('Sim', 'RunResult', 'run_replications'):
+        import mtp2_final
+        return getattr(mtp2_final, name)
+    raise AttributeError("module 'mtp' has no attribute '{name}'".format(name=name))
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--N', help='Node count', type=int)
+    parser.add_argument('--TBS', help='Txn Block Size in KB', type=int)
+    parser.add_argument('--IAR', help='Interarrival time for R-blocks in seconds', type=int)
+    parser.add_argument('--AC', help='Ack chain count', type=int)
+    parser.add_argument('--IAA', help='Interarrival time for A-blocks in seconds', type=int)
+    parser.add_argument('--duration', help='Simulation duration in minutes', type=int)
+    parser.add_argument('--seed', help='Random seed (omit for a non-reproducible run)', type=int)
+    parser.add_argument('--output_dir', help='Directory for the results file')
+    parser.add_argument('--results_db', help='Also append the results to this SQLite store (see results_store.py)')
+    parser.add_argument('--log_level', help='Per-event text log verbosity', choices=list(LOG_LEVELS))
+    parser.add_argument('--trace', help='Write a binary event trace to this file (see trace_reader.py)')
+    parser.add_argument('--metrics_window', help='Length of a metrics window in simulated seconds', type=int)
+    parser.add_argument('--metrics_out', help='Stream per-window metrics to this .jsonl or .csv file')
+    parser.add_argument('--gossip', help='flood: send every block to every neighbour; dedup: skip sends that '
+                                         'would arrive as duplicates (same outcomes, fewer events); fast: one '
+                                         'arrival per node along its fastest path (approximate, O(N) per block)',
+                        choices=['flood', 'dedup', 'fast'])
+    parser.add_argument('--links', help='independent: sends never wait for each other, with a sampled queueing '
+                                        'delay; contention: each link and node uplink transmits one send at a time',
+                        choices=['independent', 'contention'])
+    parser.add_argument('--txn_blocks', help='eager: create and broadcast each of the 10 txn blocks of an R period; '
+                                             'lazy: broadcast them as one stream and create a block only once an '
+                                             'A-block acks it', choices=['eager', 'lazy'])
+    parser.add_argument('--profile', help='Report per-event-type dispatch counts, handler time and wasted events',
+                        action='store_true')
+    parser.add_argument('--until_converged', help='Stop once the 95%% CIs of TPS, txn block delay and R-ack delay '
+                                                  'are within --ci_target; --duration becomes a cap',
+                        action='store_true')
+    parser.add_argument('--ci_target', help='Relative CI half-width for --until_converged', type=float)
+    parser.add_argument('--topology', help='Network graph: random (the original rejection-sampled graph), '
+                                           'random_regular, erdos_renyi, scale_free or file', choices=GENERATORS)
+    parser.add_argument('--degree', help='Target mean degree of generated topologies', type=int)
+    parser.add_argument('--latency', help='Link latency model of generated topologies: uniform 10-500 ms or '
+                                          'geographic region-to-region delays', choices=LATENCY_MODELS)
+    parser.add_argument('--topology_file', help='Edge list for --topology file: "u v [sol_delay_ms [speed_mbps]]" '
+                                                'per line')
+    parser.add_argument('--topology_cache', help='Directory to cache generated topologies in')
+    parser.add_argument('--finality_depth', help='Prune A-blocks more than this far below every node\'s head and '
+                                                 'every block in flight (0 keeps all history)', type=int)
+    parser.add_argument('--checkpoint_dir', help='Periodically checkpoint the simulation into this directory')
+    parser.add_argument('--checkpoint_every', help='Checkpoint interval in simulated minutes', type=int)
+    parser.set_defaults(**asdict(SimConfig()))
+
+    parser.add_argument('--resume', help='Continue the run saved in this checkpoint file', default=None)
+    parser.add_argument('--fork_from', help='Start a new run from this checkpoint; flags given here (e.g. --IAA, '
+                                            '--duration, --seed) override the checkpointed ones', default=None)
+    parser.add_argument('--replications', help='Independent replications sharing one topology, with consecutive '
+                                               'seeds; writes one consolidated JSON result file', default=1, type=int)
+    parser.add_argument('--workers', help='Worker processes for --replications (default: CPU count)', default=None,
+                        type=int)
+    parser.add_argument('--server', help='Run on the sim_server.py daemon listening on this socket', default=None)
+    return parser
+
+
+class SimClient:
+    # One connection to a sim_server.py daemon. Runs are sent as plain config dicts and answered
+    # with the run's status, metrics and console output; one run at a time per connection.
+    def __init__(self, address):
+        from multiprocessing.connection import Client
+        self.conn = Client(address, family='AF_UNIX')
+
+    def run(self, config, timeout=None):
+        config = dict(asdict(config) if is_dataclass(config) else config)
+        for name in PATH_FIELDS:
+            if config.get(name) is not None:
+                config[name] = os.path.abspath(config[name])  # the server has its own working directory
+        self.conn.send({'config': config, 'timeout': timeout})
+        response = self.conn.recv()
+        if response['status'] == 'error':
+            raise RuntimeError('Run failed on the server: ' + response['error'])
+        return response
+
+    def shutdown(self):
+        self.conn.send({'shutdown': True})
+
+    def close(self):
+        self.conn.close()
+
+
+def main(argv=None):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.resume is None and args.fork_from is None:
+        check_config(parser, config_from_args(args))  # checkpointed runs are checked once their flags are merged
+
+    if args.server is not None:
+        for flag in ('resume', 'fork_from'):
+            if getattr(args, flag) is not None:
+                parser.error('--{flag} cannot be combined with --server'.format(flag=flag))
+        if args.replications > 1:
+            parser.error('--replications cannot be combined with --server')
+        client = SimClient(args.server)
+        try:
+            response = client.run(config_from_args(args))
+        finally:
+            client.close()
+        sys.stdout.write(response.get('output', ''))
+        if response['status'] != 'ok':
+            sys.exit('Run {status} on the server'.format(status=response['status']))
+        return response
+
+    # Imported as a module even when started as mtp2_final.py, so checkpoints pickle its classes
+    # as mtp2_final.* and can be resumed through any entry point
+    import mtp2_final
+
+    if args.replications > 1:
+        for flag in ('trace', 'metrics_out', 'checkpoint_dir', 'resume', 'fork_from'):
+            if getattr(args, flag) is not None:
+                parser.error('--{flag} cannot be combined with --replications'.format(flag=flag))
+        return mtp2_final.run_replications(config_from_args(args), args.replications, args.workers)
+    elif args.resume is not None or args.fork_from is not None:
+        sim = mtp2_final.Sim.from_checkpoint(args.fork_from or args.resume, parser, fork=args.fork_from is not None,
+                                             argv=argv)
+        return sim.run(resume=True)
+    else:
+        return mtp2_final.Sim(config_from_args(args)).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,20 @@
 import numpy as np
-from queue import PriorityQueue
-import argparse
+import heapq
+import os
+import sys
+import csv
+import json
+import math
+import pickle
+import contextlib
+import copy
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from mtp import LOG_LEVELS, SimConfig, check_config, config_from_args, main
+from results_store import ResultStore
+from topology import build_topology
 
 
 class CONST:
@@ -12,6 +26,144 @@ class CONST:
     RECEIVE_A_BLOCK = 6
 
 
+class TRACE:
+    TXN_CREATED = 1
+    TXN_RECEIVED = 2
+    TXN_MUSTINCLUDE = 3
+    R_CREATED = 4
+    R_RECEIVED = 5
+    R_GENESIS = 6
+    A_CREATED = 7
+    A_RECEIVED = 8
+    A_GENESIS = 9
+
+
+# Minimum log level at which each trace kind is written to the text log
+TRACE_LEVELS = {
+    TRACE.TXN_CREATED: 1,
+    TRACE.TXN_RECEIVED: 2,
+    TRACE.TXN_MUSTINCLUDE: 1,
+    TRACE.R_CREATED: 1,
+    TRACE.R_RECEIVED: 2,
+    TRACE.R_GENESIS: 2,
+    TRACE.A_CREATED: 1,
+    TRACE.A_RECEIVED: 2,
+    TRACE.A_GENESIS: 2,
+}
+
+TRACE_MESSAGES = {
+    TRACE.TXN_CREATED: 'txn block TB{block_id} created',
+    TRACE.TXN_RECEIVED: 'Txn block T{block_id} received',
+    TRACE.TXN_MUSTINCLUDE: 'TB{block_id} became MustInclude',
+    TRACE.R_CREATED: 'R-block R{block_id} created (parent R{aux1}) and broadcasting 10 txn_blocks',
+    TRACE.R_RECEIVED: 'R-block R{block_id} received from N{aux1}',
+    TRACE.R_GENESIS: 'Setting Genesis R-block R{block_id}',
+    TRACE.A_CREATED: 'A-block A{block_id} created (parent A{aux1}) in ack_chain AC{aux2}',
+    TRACE.A_RECEIVED: 'A-block A{block_id} received in ack_chain AC{aux1}',
+    TRACE.A_GENESIS: 'Setting Genesis A-block A{block_id}',
+}
+
+TRACE_DTYPE = np.dtype([('time', '<f8'), ('node', '<i4'), ('kind', '<i2'),
+                        ('block_id', '<i8'), ('aux1', '<i8'), ('aux2', '<i4')])
+
+
+def truncate_file(path, size):
+    with open(path, 'r+b') as f:
+        f.truncate(size)
+
+
+def format_trace_record(time, node_id, kind, block_id, aux1=-1, aux2=-1):
+    msg = TRACE_MESSAGES[kind].format(block_id=block_id, aux1=aux1, aux2=aux2)
+    return "Time : {time:.3f} | N{node_id} | {msg}".format(time=time / 1000, node_id=node_id, msg=msg)
+
+
+class EventLog:
+    # Replaces per-event print. Text lines are only formatted when the level asks for them and
+    # are written in bulk; the optional binary trace keeps every record in a preallocated
+    # array that is appended to trace_path whenever it fills up (see trace_reader.py).
+    TEXT_BUFFER_LINES = 4096
+    TRACE_BUFFER_RECORDS = 1 << 16
+
+    def __init__(self, sim, level='off', trace_path=None):
+        self.sim = sim
+        self.level = LOG_LEVELS[level]
+        self.text_lines = []
+
+        self.trace_path = None
+        self.trace_file = None
+        self.trace_buf = None
+        self.trace_count = 0
+        self.trace_offset = 0
+        self.open_trace(trace_path, 'wb')
+
+        self.active = self.level > 0 or self.trace_file is not None
+
+    def open_trace(self, trace_path, mode):
+        self.trace_path = trace_path
+        if trace_path is not None:
+            self.trace_file = open(trace_path, mode)
+            self.trace_buf = np.empty(self.TRACE_BUFFER_RECORDS, dtype=TRACE_DTYPE)
+            self.trace_count = 0
+
+    def prepare_checkpoint(self):
+        # Flush everything so the checkpoint holds no buffered records, and remember how much
+        # of the trace file belongs to the checkpointed state
+        self.flush_text()
+        if self.trace_file is not None:
+            self.flush_trace()
+            self.trace_file.flush()
+            self.trace_offset = os.fstat(self.trace_file.fileno()).st_size
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['trace_file'] = None
+        state['trace_buf'] = None
+        return state
+
+    def reopen(self, level, trace_path, resume=True):
+        # After loading a checkpoint: a resumed run continuing into the same trace file drops
+        # whatever was written after the checkpoint; a fork or a different file starts a fresh trace
+        self.level = LOG_LEVELS[level]
+        if resume and trace_path is not None and trace_path == self.trace_path and os.path.exists(trace_path):
+            truncate_file(trace_path, self.trace_offset)
+            self.open_trace(trace_path, 'ab')
+        else:
+            self.open_trace(trace_path, 'wb')
+        self.active = self.level > 0 or self.trace_file is not None
+
+    def record(self, kind, node_id, block_id, aux1=-1, aux2=-1):
+        if not self.active:
+            return
+
+        if self.trace_file is not None:
+            self.trace_buf[self.trace_count] = (self.sim.cur_time, node_id, kind, block_id, aux1, aux2)
+            self.trace_count += 1
+            if self.trace_count == self.TRACE_BUFFER_RECORDS:
+                self.flush_trace()
+
+        if self.level >= TRACE_LEVELS[kind]:
+            self.text_lines.append(format_trace_record(self.sim.cur_time, node_id, kind, block_id, aux1, aux2))
+            if len(self.text_lines) >= self.TEXT_BUFFER_LINES:
+                self.flush_text()
+
+    def flush_text(self):
+        if self.text_lines:
+            sys.stdout.write('\n'.join(self.text_lines) + '\n')
+            self.text_lines = []
+
+    def flush_trace(self):
+        self.trace_buf[:self.trace_count].tofile(self.trace_file)
+        self.trace_count = 0
+
+    def close(self):
+        self.flush_text()
+        if self.trace_file is not None:
+            self.flush_trace()
+            self.trace_file.close()
+            self.trace_file = None
+        self.active = False
+
+
 class ID:
     def __init__(self):
         self.R_bid = 0
@@ -31,24 +183,169 @@ class ID:
         self.Txn_block_id += 1
         return self.Txn_block_id - 1
 
+    def new_Txn_block_ids(self, count):
+        # A dense run of ids, the first of which is returned
+        self.Txn_block_id += count
+        return self.Txn_block_id - count
+
     def new_txn_id(self):
         self.Txn_id += 1
         return self.Txn_id - 1
 
 
+class RNG:
+    # Per-simulation random source. Draws are served from prebuilt buffers that are refilled
+    # in chunks, so hot paths avoid a NumPy call per scalar and never touch global state.
+    POOL_SIZE = 1 << 16
+
+    def __init__(self, seed=None):
+        self.generator = np.random.default_rng(seed)
+        self.refill_exponential()
+        self.refill_uniform()
+
+    def __getstate__(self):
+        # The list copies are rebuilt from the buffers on load
+        state = dict(self.__dict__)
+        del state['exp_list']
+        del state['uni_list']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.exp_list = self.exp_buf.tolist()
+        self.uni_list = self.uni_buf.tolist()
+
+    def refill_exponential(self):
+        self.exp_buf = self.generator.standard_exponential(self.POOL_SIZE)
+        self.exp_list = self.exp_buf.tolist()
+        self.exp_pos = 0
+
+    def refill_uniform(self):
+        self.uni_buf = self.generator.random(self.POOL_SIZE)
+        self.uni_list = self.uni_buf.tolist()
+        self.uni_pos = 0
+
+    def exponential(self, scale):
+        if self.exp_pos >= self.POOL_SIZE:
+            self.refill_exponential()
+        value = self.exp_list[self.exp_pos]
+        self.exp_pos += 1
+        return value * scale
+
+    def exponentials(self, scales):
+        n = len(scales)
+        if self.exp_pos + n > self.POOL_SIZE:
+            self.refill_exponential()
+        values = self.exp_buf[self.exp_pos:self.exp_pos + n]
+        self.exp_pos += n
+        return values * scales
+
+    def gammas(self, shapes, scales):
+        # Vector draws straight from the generator; only --gossip fast needs them
+        return self.generator.gamma(shapes, scales)
+
+    def uniform(self, low, high):
+        if self.uni_pos >= self.POOL_SIZE:
+            self.refill_uniform()
+        value = self.uni_list[self.uni_pos]
+        self.uni_pos += 1
+        return low + (high - low) * value
+
+
 class Event:
+    __slots__ = ('type', 'receiver', 'sender', 'data', 'cancelled')
+
     def __init__(self, type, sender, receiver, data):
         self.type = type
         self.receiver = receiver
         self.sender = sender
         self.data = data
+        self.cancelled = False
 
-    def __lt__(self, other):
-        return 0
+
+class EventScheduler:
+    # Single-threaded replacement for queue.PriorityQueue. Entries are (time, seq, event);
+    # the sequence number breaks same-time ties in insertion order, so events are never compared.
+    COMPACT_MIN_CANCELLED = 1 << 16
+
+    def __init__(self):
+        self.heap = []
+        self.seq = 0
+        self.cancelled_skipped = 0
+        self.cancelled_in_heap = 0
+        self.last_entry = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def put(self, time, event):
+        heapq.heappush(self.heap, (time, self.seq, event))
+        self.seq += 1
+
+    def put_many(self, entries):
+        seq = self.seq
+        batch = []
+        for time, event in entries:
+            batch.append((time, seq, event))
+            seq += 1
+        self.seq = seq
+
+        heap = self.heap
+        if len(batch) * 4 > len(heap):
+            heap.extend(batch)
+            heapq.heapify(heap)
+        else:
+            for entry in batch:
+                heapq.heappush(heap, entry)
+
+    def cancel(self, event):
+        # Lazy cancellation: the entry stays in the heap and is dropped when it reaches the top.
+        # Cancelling the event being dispatched (already popped) leaves nothing behind in the heap.
+        # Returns whether a queued entry was cancelled.
+        if event.cancelled:
+            return False
+        event.cancelled = True
+        if self.last_entry is not None and self.last_entry[2] is event:
+            return False
+        self.cancelled_in_heap += 1
+        if self.cancelled_in_heap > self.COMPACT_MIN_CANCELLED and self.cancelled_in_heap * 2 > len(self.heap):
+            self.compact()
+        return True
+
+    def compact(self):
+        # With large N most of the heap can be dead entries (e.g. dedup gossip cancels every
+        # redundant genesis send during setup). (time, seq) keys are unique, so rebuilding
+        # without them leaves the pop order unchanged.
+        heap = [entry for entry in self.heap if not entry[2].cancelled]
+        self.cancelled_skipped += len(self.heap) - len(heap)
+        heapq.heapify(heap)
+        self.heap = heap
+        self.cancelled_in_heap = 0
+
+    def get(self):
+        heap = self.heap
+        while heap:
+            entry = heapq.heappop(heap)
+            time, _, event = entry
+            if not event.cancelled:
+                self.last_entry = entry
+                return time, event
+            self.cancelled_skipped += 1
+            self.cancelled_in_heap -= 1
+        return None
+
+    def unget(self):
+        # Put back the entry returned by the last get(), keeping its original tie-break order. It is
+        # queued again, so a later cancel has to count it as a dead heap entry.
+        heapq.heappush(self.heap, self.last_entry)
+        self.last_entry = None
 
 
 class R_Block:
-    def __init__(self, block_id, creator, creation_time, depth, parent_id):
+    __slots__ = ('block_id', 'creator', 'creation_time', 'depth', 'parent_id', 'txn_block_list', 'mi_txn_blocks',
+                 'size', 'ack_flags', 'pending_acks', 'ack_cursors')
+
+    def __init__(self, block_id, creator, creation_time, depth, parent_id, ack_chain_count):
         self.block_id = block_id
         self.creator = creator
         self.creation_time = creation_time
@@ -57,10 +354,17 @@ class R_Block:
         self.txn_block_list = []
         self.mi_txn_blocks = set()
         self.size = 0
-        self.acks = set()
+        # ack_flags[c] is set while ack chain c acks this block; pending_acks counts the unset ones
+        self.ack_flags = bytearray(ack_chain_count)
+        self.pending_acks = ack_chain_count
+        # ack_cursors[c] is the index in txn_block_list of the first txn block not acked on chain c
+        self.ack_cursors = [0] * ack_chain_count
 
 
 class A_Block:
+    __slots__ = ('block_id', 'creator', 'creation_time', 'depth', 'parent_id', 'size', 'ack_id', 'ack_for',
+                 'in_flight')
+
     def __init__(self, block_id, creator, creation_time, depth, parent_id, ack_id):
         self.block_id = block_id
         self.creator = creator
@@ -70,10 +374,14 @@ class A_Block:
         self.size = 0
         self.ack_id = ack_id
         self.ack_for = []
+        self.in_flight = 0  # queued RECEIVE events for this block; it stays live while any remain
 
 
 class Txn_Block:
-    def __init__(self, R_block, block_id, creator, creation_time, depth, parent_id):
+    __slots__ = ('R_block', 'block_id', 'creator', 'creation_time', 'depth', 'parent_id', 'txn_count', 'size',
+                 'ack_flags', 'pending_acks', 'block_number')
+
+    def __init__(self, R_block, block_id, creator, creation_time, depth, parent_id, ack_chain_count):
         self.R_block = R_block
         self.block_id = block_id
         self.creator = creator
@@ -82,60 +390,266 @@ class Txn_Block:
         self.parent_id = parent_id
         self.txn_count = 0
         self.size = 0
-        self.acks = set()
+        self.ack_flags = bytearray(ack_chain_count)
+        self.pending_acks = ack_chain_count
         self.block_number = 0
 
 
-class BTNode:
-    def __init__(self, block, parent_btnode):
-        self.block = block
-        self.parent_btnode = parent_btnode
-        self.children = []
+class Txn_Range:
+    # --txn_blocks lazy: all txn blocks of one R period as a single descriptor, used as the
+    # R-block's txn_block_list. Their ids are reserved up front and they propagate as one stream;
+    # a Txn_Block object is only materialised when indexing asks for it, i.e. when an A-block
+    # acks it. The range shares its first block's id for flags, dedup and the trace.
+    __slots__ = ('R_block', 'block_id', 'count', 'creator', 'creation_time', 'depth', 'parent_id', 'parent_base',
+                 'txn_count', 'block_size', 'size', 'ack_chain_count', 'blocks')
+
+    def __init__(self, R_block, block_id, count, creator, creation_time, parent, txn_count, block_size,
+                 ack_chain_count):
+        self.R_block = R_block
+        self.block_id = block_id
+        self.count = count
+        self.creator = creator
+        self.creation_time = creation_time
+        self.depth = parent.depth + 1  # of the first block
+        self.parent_id = parent.block_id
+        self.parent_base = parent.block_id - parent.block_number  # first id of the parent's range
+        self.txn_count = txn_count
+        self.block_size = block_size
+        self.size = count * block_size
+        self.ack_chain_count = ack_chain_count
+        self.blocks = [None] * count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        block = self.blocks[index]
+        if block is None:
+            parent_id = self.block_id + index - 1 if index else self.parent_id
+            block = Txn_Block(self.R_block, self.block_id + index, self.creator, self.creation_time,
+                              self.depth + index, parent_id, self.ack_chain_count)
+            block.txn_count = self.txn_count
+            block.size = self.block_size
+            block.block_number = index
+            self.blocks[index] = block
+        return block
+
+
+class BlockTable:
+    # Canonical block DAG for one block kind, shared by every node. Block ids of a kind are
+    # dense and start at 0, so the id is the row index of every column. Nodes only hold their
+    # own flags and heads on top of this.
+    INITIAL_CAPACITY = 1024
+
+    COLUMNS = {
+        'depth': (np.int32, 0),
+        'parent': (np.int64, -1),
+        'skip': (np.int64, -1),
+    }
+
+    def __init__(self):
+        self.blocks = []
+        self.finalized = 0  # node flags start at this id; lower blocks are pruned unless retained
+        self.retained_flags = {}  # block id below finalized -> flag of every node, for blocks still kept
+        for column, (dtype, fill) in self.COLUMNS.items():
+            setattr(self, column, np.full(self.INITIAL_CAPACITY, fill, dtype=dtype))
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def grow(self):
+        capacity = 2 * len(self.depth)
+        for column, (dtype, fill) in self.COLUMNS.items():
+            old = getattr(self, column)
+            new = np.full(capacity, fill, dtype=dtype)
+            new[:len(old)] = old
+            setattr(self, column, new)
+
+    def add(self, block):
+        block_id = block.block_id
+        if block_id != len(self.blocks):
+            raise ValueError('Blocks must be added in id order (expected id ' + str(len(self.blocks)) +
+                             ', got ' + str(block_id) + ')')
+        if block_id >= len(self.depth):
+            self.grow()
+
+        self.blocks.append(block)
+        self.depth[block_id] = block.depth
+        self.parent[block_id] = block.parent_id
+        if block.parent_id != -1:
+            self.skip[block_id] = self.ancestor(block.parent_id, skip_depth(block.depth))
+
+    def ancestor(self, block_id, depth):
+        # Binary-lifting walk: follow the skip pointer whenever it does not overshoot, which
+        # reaches any ancestor in O(log depth) steps
+        parent = self.parent
+        skip = self.skip
+        walk_depth = int(self.depth[block_id])
+        while walk_depth > depth:
+            walk_skip_depth = skip_depth(walk_depth)
+            prev_skip_depth = skip_depth(walk_depth - 1)
+            if skip[block_id] != -1 and (walk_skip_depth == depth or (
+                    walk_skip_depth > depth and not (prev_skip_depth < walk_skip_depth - 2 and
+                                                     prev_skip_depth >= depth))):
+                block_id = int(skip[block_id])
+                walk_depth = walk_skip_depth
+            else:
+                block_id = int(parent[block_id])
+                walk_depth -= 1
+        return block_id
+
+    def common_ancestor(self, a, b):
+        depth_a = int(self.depth[a])
+        depth_b = int(self.depth[b])
+        if depth_a > depth_b:
+            a = self.ancestor(a, depth_b)
+        elif depth_b > depth_a:
+            b = self.ancestor(b, depth_a)
+
+        # Both heads are now at the same depth, so their skip pointers land at the same depth too
+        parent = self.parent
+        skip = self.skip
+        while a != b:
+            if skip[a] != skip[b]:
+                a = int(skip[a])
+                b = int(skip[b])
+            else:
+                a = int(parent[a])
+                b = int(parent[b])
+        return a
+
+    def path(self, from_id, to_id):
+        # Blocks from from_id (inclusive) up to its ancestor to_id (exclusive), newest first
+        blocks = self.blocks
+        parent = self.parent
+        branch = []
+        while from_id != to_id:
+            block = blocks[from_id]
+            if block is None:
+                raise RuntimeError('Reorganisation below the finality depth (block {id} is pruned); '
+                                   'rerun with a larger --finality_depth'.format(id=from_id))
+            branch.append(block)
+            from_id = int(parent[from_id])
+        return branch
+
+    def prune(self, upto, keep, nodes):
+        # Move the flag base up to upto. Blocks below it that are in keep stay, with their node
+        # flags copied into retained_flags; every other object is dropped (the columns are kept
+        # for ancestor walks). Returns the number of objects dropped.
+        blocks = self.blocks
+        retained_flags = self.retained_flags
+        dropped = 0
+        for block_id in [block_id for block_id in retained_flags if block_id not in keep]:
+            del retained_flags[block_id]
+            blocks[block_id] = None
+            dropped += 1
+
+        base = self.finalized
+        for block_id in range(base, upto):
+            if block_id in keep:
+                index = block_id - base
+                retained_flags[block_id] = bytes(node.A_flags[index] if index < len(node.A_flags) else 0
+                                                 for node in nodes)
+            else:
+                blocks[block_id] = None
+                dropped += 1
+        for node in nodes:
+            del node.A_flags[:upto - base]
+        self.finalized = upto
+        return dropped
+
+
+def skip_depth(depth):
+    # Depth targeted by a block's skip pointer (same scheme as Bitcoin's GetSkipHeight)
+    if depth < 2:
+        return 0
+    if depth & 1:
+        depth -= 1
+        depth &= depth - 1
+        return (depth & (depth - 1)) + 1
+    return depth & (depth - 1)
+
+
+class BlockStore:
+    def __init__(self):
+        self.R = BlockTable()
+        self.A = BlockTable()
+        self.T = BlockTable()
+
+
+class FLAG:
+    SEEN = 1
+    ACCEPTED = 2
 
 
-class Connection:
-    def __init__(self, nbr_id, sol_delay, speed):
-        self.nbr_id = nbr_id
-        self.sol_delay = sol_delay
-        self.speed = speed
+# Per-node flags and the BlockStore table checked for each RECEIVE_* event type
+FLAG_ATTRS = {
+    CONST.RECEIVE_R_BLOCK: 'R_flags',
+    CONST.RECEIVE_A_BLOCK: 'A_flags',
+    CONST.RECEIVE_TXN_BLOCK: 'T_flags',
+}
+FLAG_TABLES = {
+    CONST.RECEIVE_R_BLOCK: 'R',
+    CONST.RECEIVE_A_BLOCK: 'A',
+    CONST.RECEIVE_TXN_BLOCK: 'T',
+}
+
+
+def has_flag(flags, block_id, flag, base=0):
+    # flags[0] belongs to block id base; every block below base is final, so seen and accepted
+    block_id -= base
+    if block_id < 0:
+        return True
+    return block_id < len(flags) and flags[block_id] & flag
+
+
+def set_flag(flags, block_id, flag, base=0):
+    block_id -= base
+    if block_id < 0:
+        return
+    if block_id >= len(flags):
+        flags.extend(bytes(max(len(flags), block_id + 1 - len(flags))))
+    flags[block_id] |= flag
 
 
 class Node:
     def __init__(self, node_id, sim):
         self.node_id = node_id
         self.sim = sim
-        self.nbrs = {}
-        self.block_id_to_btnode = {}
+        self.link_ids = None
+        self.link_index = {}
+        self.link_sol_delays = None
+        self.link_speeds = None
+        self.link_queing_means = None
+        self.link_busy_until = None  # --links contention: when each link finishes its last queued send
+        self.uplink_speed = 0
+        self.uplink_busy_until = 0
         self.R_mining_head = None
         self.A_mining_heads = {}
-        self.received_R_blocks = set()
-        self.received_Txn_blocks = set()
-        self.received_A_blocks = set()
+        # Per-block FLAG bits indexed by block id; the blocks themselves live in Sim.blocks
+        self.R_flags = bytearray()
+        self.A_flags = bytearray()
+        self.T_flags = bytearray()
         self.scheduled_next_block_generation_ack_chain_id = -1
         self.last_txn_block_to_follow = None
-        self.active_R_periods = set()
-
-        self.max_link_speed = int(np.random.uniform(5, 101)) * 1024 * 1024
-
-    def setup_connections(self):
-        count = int(np.random.uniform(6, 12))
-
-        if count > self.sim.NODE_COUNT - 1:
-            count = self.sim.NODE_COUNT - 1
-
-        count -= len(self.nbrs)
-
-        while count > 0:
-            nbr_id = int(np.random.uniform(0, self.sim.NODE_COUNT))
-            if nbr_id == self.node_id or nbr_id in self.nbrs:
-                continue
-
-            sol_delay = int(np.random.uniform(10, 501))
-            speed = min(self.max_link_speed, self.sim.nodes[nbr_id].max_link_speed)
-
-            self.nbrs[nbr_id] = Connection(nbr_id, sol_delay, speed)
-            self.sim.nodes[nbr_id].nbrs[self.node_id] = Connection(self.node_id, sol_delay, speed)
-            count -= 1
+        self.active_R_periods = {}  # used as an insertion-ordered set so seeded runs replay identically
+        self.pending_R_generation = None
+        self.pending_A_generation = None
+        # --gossip dedup only: (event type, block id) -> (arrival time, event) of the earliest send in flight
+        self.inbound = {}
+
+        self.max_link_speed = int(sim.rng.uniform(5, 101)) * 1024 * 1024
+
+    def build_link_arrays(self, topology):
+        # The graph is static, so each node keeps views of its slice of the CSR arrays
+        start, end = topology.indptr[self.node_id], topology.indptr[self.node_id + 1]
+        self.link_ids = topology.indices[start:end]
+        self.link_index = {nbr_id: i for i, nbr_id in enumerate(self.link_ids.tolist())}
+        self.link_sol_delays = topology.sol_delays[start:end]
+        self.link_speeds = topology.speeds[start:end]
+        self.link_queing_means = ((96 * 1024) / self.link_speeds) * 1000
+        self.link_busy_until = np.zeros(end - start)
+        self.uplink_speed = float(topology.uplinks[self.node_id])
 
     def setup_genesis_blocks(self, GR_block, Gtxn_block, Gack_blocks):
         dummy_event = Event(-1, -1, -1, GR_block)
@@ -147,62 +661,210 @@ class Node:
             self.receive_A_block(dummy_event)
 
     def broadcast(self, type, size, data, received_from=-1):
-        for nbr_id in self.nbrs:
-            if nbr_id == received_from:
+        if self.sim.gossip_fast:
+            # Only the creator sends: every reachable node gets one arrival along its fastest path
+            if data.creator == self.node_id:
+                self.queue_sends(type, data, self.fast_sends(type, size, data))
+            return
+
+        nbr_ids = self.link_ids
+        sol_delays = self.link_sol_delays
+        speeds = self.link_speeds
+        queing_means = self.link_queing_means
+
+        keep = None
+        skip = self.link_index.get(received_from)
+        if skip is not None:
+            keep = np.ones(len(nbr_ids), dtype=bool)
+            keep[skip] = False
+            nbr_ids = nbr_ids[keep]
+            sol_delays = sol_delays[keep]
+            speeds = speeds[keep]
+            queing_means = queing_means[keep]
+
+        if self.sim.profiler is not None:
+            self.sim.profiler.record_fanout(len(nbr_ids))
+
+        if len(nbr_ids) == 0:
+            return
+
+        if self.sim.link_contention:
+            next_times = self.contended_arrivals(size, keep, sol_delays, speeds)
+        else:
+            queing_delays = self.sim.rng.exponentials(queing_means).astype(np.int64)
+            next_times = self.sim.cur_time + (sol_delays + ((size / speeds) * 1000) + queing_delays)
+
+        if self.sim.gossip_dedup:
+            self.queue_sends(type, data, self.dedup_sends(type, data, next_times.tolist(), nbr_ids.tolist()))
+            return
+
+        node_id = self.node_id
+        self.queue_sends(type, data, [(next_time, Event(type, node_id, nbr_id, data))
+                                      for next_time, nbr_id in zip(next_times.tolist(), nbr_ids.tolist())])
+
+    def queue_sends(self, type, data, entries):
+        if type == CONST.RECEIVE_A_BLOCK:
+            data.in_flight += len(entries)
+        self.sim.event_queue.put_many(entries)
+
+    def cancel_send(self, event):
+        if self.sim.event_queue.cancel(event) and event.type == CONST.RECEIVE_A_BLOCK:
+            event.data.in_flight -= 1
+
+    def contended_arrivals(self, size, keep, sol_delays, speeds):
+        # --links contention: instead of sampled queueing delays, every link transmits its sends
+        # one after another, and the copies of one broadcast leave through the node's uplink in
+        # turn, so the node never uploads faster than uplink_speed
+        now = self.sim.cur_time
+        busy_until = self.link_busy_until if keep is None else self.link_busy_until[keep]
+        done = np.maximum(busy_until, now) + (size / speeds) * 1000
+
+        uplink_time = (size / self.uplink_speed) * 1000
+        uplink_done = max(now, self.uplink_busy_until) + uplink_time * np.arange(1, len(done) + 1)
+        np.maximum(done, uplink_done, out=done)
+        self.uplink_busy_until = uplink_done[-1]
+
+        if keep is None:
+            self.link_busy_until = done.copy()
+        else:
+            self.link_busy_until[keep] = done
+        return done + sol_delays
+
+    def fast_sends(self, type, size, data):
+        # --gossip fast: one event per reachable node, at the deterministic fastest-path delay plus
+        # gamma-distributed queueing jitter with the path's summed mean and one exponential's
+        # worth of shape per hop
+        sim = self.sim
+        targets, delays, shapes, scales = sim.arrival_profile(self.node_id, size)
+        times = sim.cur_time + delays + np.floor(sim.rng.gammas(shapes, scales))
+
+        # Flooding only forwards blocks the forwarder accepted, so a block never overtakes its
+        # parent (or, for txn blocks, its R-block); a node receiving it first would drop it for good
+        # A Txn_Range's parent stream is keyed by its first block
+        parent_keys = [(type, data.parent_base if isinstance(data, Txn_Range) else data.parent_id)]
+        if type == CONST.RECEIVE_TXN_BLOCK:
+            parent_keys.append((CONST.RECEIVE_R_BLOCK, data.R_block.block_id))
+        for parent_key in parent_keys:
+            parent = sim.fast_arrivals.get(parent_key)
+            if parent is not None and parent[0] > sim.cur_time:
+                times = np.maximum(times, parent[1][targets])
+        sim.record_fast_arrivals((type, data.block_id), targets, times)
+
+        if sim.profiler is not None:
+            sim.profiler.record_fanout(len(targets))
+        node_id = self.node_id
+        return [(time, Event(type, node_id, target, data)) for time, target in zip(times.tolist(), targets.tolist())]
+
+    def drop_inbound(self, type, block_id):
+        # The block is now seen, so any send still in flight to this node is a duplicate
+        pending = self.inbound.pop((type, block_id), None)
+        if pending is not None:
+            self.cancel_send(pending[1])
+
+    def dedup_sends(self, type, data, next_times, nbr_ids):
+        # --gossip dedup: drop sends whose arrival is guaranteed to be a duplicate. A neighbour that
+        # has already seen the block would ignore it, and of several sends in flight to the same
+        # neighbour only the earliest arrival is ever processed, so later ones are never queued
+        # (or are cancelled when an earlier one is scheduled). Outcomes are identical to flooding.
+        nodes = self.sim.nodes
+        flags_attr = FLAG_ATTRS[type]
+        block_id = data.block_id
+        index = block_id - getattr(self.sim.blocks, FLAG_TABLES[type]).finalized  # has_flag, inlined
+        seen = FLAG.SEEN
+        key = (type, block_id)
+        entries = []
+        suppressed = 0
+        for next_time, nbr_id in zip(next_times, nbr_ids):
+            nbr = nodes[nbr_id]
+            flags = getattr(nbr, flags_attr)
+            if index < 0 or (index < len(flags) and flags[index] & seen):
+                suppressed += 1
                 continue
-            conn = self.nbrs[nbr_id]
-            queing_delay = int(np.random.exponential((((96 * 1024) / conn.speed) * 1000)))
-            delay = conn.sol_delay + ((size / conn.speed) * 1000) + queing_delay
-            next_time = self.sim.cur_time + delay
+
+            pending = nbr.inbound.get(key)
+            if pending is not None:
+                suppressed += 1
+                if pending[0] <= next_time:
+                    continue
+                self.cancel_send(pending[1])
+
             event = Event(type, self.node_id, nbr_id, data)
-            self.sim.event_queue.put((next_time, event))
+            nbr.inbound[key] = (next_time, event)
+            entries.append((next_time, event))
+
+        self.sim.suppressed_sends += suppressed
+        return entries
 
     def schedule_R_block_generation(self):
-        next_time = int(self.sim.cur_time + np.random.exponential(self.sim.R_MEAN_BLOCK_TIME))
-        self.sim.event_queue.put((next_time, Event(CONST.CREATE_R_BLOCK, self.node_id, self.node_id,
-                                                   data=self.R_mining_head)))
+        # The previously scheduled generation was mining on the old head and is now stale
+        if self.pending_R_generation is not None:
+            self.sim.event_queue.cancel(self.pending_R_generation)
+
+        next_time = int(self.sim.cur_time + self.sim.rng.exponential(self.sim.R_MEAN_BLOCK_TIME))
+        event = Event(CONST.CREATE_R_BLOCK, self.node_id, self.node_id, data=self.R_mining_head)
+        self.pending_R_generation = event
+        self.sim.event_queue.put(next_time, event)
 
     def schedule_A_block_generation(self):
-        next_time = int(self.sim.cur_time + np.random.exponential(self.sim.A_MEAN_BLOCK_TIME))
-        ack_id = int(np.random.uniform(0, self.sim.ACK_CHAIN_COUNT))
+        if self.pending_A_generation is not None:
+            self.sim.event_queue.cancel(self.pending_A_generation)
+
+        next_time = int(self.sim.cur_time + self.sim.rng.exponential(self.sim.A_MEAN_BLOCK_TIME))
+        ack_id = int(self.sim.rng.uniform(0, self.sim.ACK_CHAIN_COUNT))
         self.scheduled_next_block_generation_ack_id = ack_id
-        self.sim.event_queue.put((next_time, Event(CONST.CREATE_A_BLOCK, self.node_id, self.node_id,
-                                                   data=(self.A_mining_heads[ack_id], ack_id))))
+        event = Event(CONST.CREATE_A_BLOCK, self.node_id, self.node_id, data=(self.A_mining_heads[ack_id], ack_id))
+        self.pending_A_generation = event
+        self.sim.event_queue.put(next_time, event)
 
     def create_txn_block(self, R_block, last_txn_block_to_follow):
 
         txn_block_id = self.sim.ID.new_Txn_block_id()
         block_depth = last_txn_block_to_follow.depth + 1
         parent_id = last_txn_block_to_follow.block_id
-        txn_block = Txn_Block(R_block, txn_block_id, self.node_id, self.sim.cur_time, block_depth, parent_id)
+        txn_block = Txn_Block(R_block, txn_block_id, self.node_id, self.sim.cur_time, block_depth, parent_id,
+                              self.sim.ACK_CHAIN_COUNT)
         max_txn_count = int(self.sim.TXN_BLOCK_SIZE / self.sim.avg_txn_size)
         txn_block.txn_count = max_txn_count #int(np.random.uniform(max_txn_count - 100, max_txn_count))
         txn_block.size = txn_block.txn_count * self.sim.avg_txn_size
 
-        self.sim.P(self.node_id, 'txn block TB' + str(txn_block.block_id) + ' created')
+        self.sim.blocks.T.add(txn_block)
+        self.sim.log.record(TRACE.TXN_CREATED, self.node_id, txn_block.block_id)
 
         return txn_block
 
+    def create_txn_range(self, R_block):
+        txn_count = int(self.sim.TXN_BLOCK_SIZE / self.sim.avg_txn_size)
+        txn_range = Txn_Range(R_block, self.sim.ID.new_Txn_block_ids(10), 10, self.node_id, self.sim.cur_time,
+                              self.last_txn_block_to_follow, txn_count, txn_count * self.sim.avg_txn_size,
+                              self.sim.ACK_CHAIN_COUNT)
+        R_block.txn_block_list = txn_range
+        for block_id in range(txn_range.block_id, txn_range.block_id + txn_range.count):
+            self.sim.log.record(TRACE.TXN_CREATED, self.node_id, block_id)
+        self.broadcast(CONST.RECEIVE_TXN_BLOCK, txn_range.size, txn_range, self.node_id)
+
     def create_R_block(self, event):
         prev_mining_head = event.data
         if self.R_mining_head != prev_mining_head:
             return
 
         parent_id = self.R_mining_head
-        parent_btnode = self.block_id_to_btnode[parent_id]
-        block_depth = parent_btnode.block.depth + 1
+        block_depth = self.sim.blocks.R.blocks[parent_id].depth + 1
 
-        R_block = R_Block(self.sim.ID.new_R_block_id(), self.node_id, self.sim.cur_time, block_depth, parent_id)
+        R_block = R_Block(self.sim.ID.new_R_block_id(), self.node_id, self.sim.cur_time, block_depth, parent_id,
+                          self.sim.ACK_CHAIN_COUNT)
         R_block.size = 128 * 8
 
-        self.sim.ALL_R_blocks.append(R_block)
+        self.sim.blocks.R.add(R_block)
 
-        self.sim.P(self.node_id, 'R-block R' + str(R_block.block_id) + ' created (parent R' + str(
-            parent_id) + ') and broadcasting 10 txn_blocks')
+        self.sim.log.record(TRACE.R_CREATED, self.node_id, R_block.block_id, parent_id)
 
         dummy_event = Event(-1, -1, -1, R_block)
         self.receive_R_block(dummy_event)
 
+        if self.sim.lazy_txn_blocks:
+            self.create_txn_range(R_block)
+            return
+
         l_txn_block_to_follow = self.last_txn_block_to_follow
         for i in range(10):
             txn_block = self.create_txn_block(R_block, l_txn_block_to_follow)
@@ -214,77 +876,60 @@ class Node:
     def receive_R_block(self, event):
         R_block = event.data
 
-        if R_block.block_id in self.received_R_blocks:
+        if has_flag(self.R_flags, R_block.block_id, FLAG.SEEN):
             return
-        self.received_R_blocks.add(R_block.block_id)
+        set_flag(self.R_flags, R_block.block_id, FLAG.SEEN)
+        if self.inbound:
+            self.drop_inbound(CONST.RECEIVE_R_BLOCK, R_block.block_id)
 
         if self.process_R_block(event.data):
             self.broadcast(CONST.RECEIVE_R_BLOCK, R_block.size, R_block, event.sender)
 
         if R_block.creator == -1:
-            self.sim.P(self.node_id, 'Setting Genesis R-block R' + str(R_block.block_id))
+            self.sim.log.record(TRACE.R_GENESIS, self.node_id, R_block.block_id)
         else:
-            self.sim.P(self.node_id, 'R-block R' + str(R_block.block_id) +
-                       ' received from N' + str(R_block.creator))
+            self.sim.log.record(TRACE.R_RECEIVED, self.node_id, R_block.block_id, R_block.creator)
 
     def process_R_block(self, R_block):
         parent_id = R_block.parent_id
 
         if parent_id == -1:  # Genesis block
-            new_btnode = BTNode(R_block, None)
-            self.block_id_to_btnode[R_block.block_id] = new_btnode
+            set_flag(self.R_flags, R_block.block_id, FLAG.ACCEPTED)
             self.switch_R_branch(R_block.block_id, True)
-            self.active_R_periods.add(R_block)
+            self.active_R_periods[R_block] = None
             return True
 
-        if parent_id not in self.block_id_to_btnode:
+        if not has_flag(self.R_flags, parent_id, FLAG.ACCEPTED):
             return False
 
-        parent_btnode = self.block_id_to_btnode[parent_id]
-        if (parent_btnode.block.depth + 1) != R_block.depth:
+        R_blocks = self.sim.blocks.R.blocks
+        parent_block = R_blocks[parent_id]
+        if (parent_block.depth + 1) != R_block.depth:
             return False
 
-        new_btnode = BTNode(R_block, parent_btnode)
-        self.block_id_to_btnode[R_block.block_id] = new_btnode
-        parent_btnode.children.append(new_btnode)
+        set_flag(self.R_flags, R_block.block_id, FLAG.ACCEPTED)
 
-        if parent_btnode.block in self.active_R_periods:
-            self.active_R_periods.remove(parent_btnode.block)
-        self.active_R_periods.add(R_block)
+        self.active_R_periods.pop(parent_block, None)
+        self.active_R_periods[R_block] = None
 
-        if self.block_id_to_btnode[self.R_mining_head].block.depth < R_block.depth:
+        if R_blocks[self.R_mining_head].depth < R_block.depth:
             self.switch_R_branch(R_block.block_id)
         return True
 
     def switch_R_branch(self, new_block_id, is_genesis=False):
+        R_table = self.sim.blocks.R
         if is_genesis:
-            self.add_R_block(self.block_id_to_btnode[new_block_id].block)
+            self.add_R_block(R_table.blocks[new_block_id])
             self.R_mining_head = new_block_id
             return
 
-        old_head = self.block_id_to_btnode[self.R_mining_head]
-        new_head = self.block_id_to_btnode[new_block_id]
-        old_branch = []
-        new_branch = []
-
-        while True:
-            if new_head in old_branch:
-                joint = new_head
-                break
-            else:
-                new_branch.append(new_head)
-                new_head = new_head.parent_btnode
-            if old_head:
-                old_branch.append(old_head)
-                old_head = old_head.parent_btnode
+        joint_id = R_table.common_ancestor(self.R_mining_head, new_block_id)
 
-        old_head = self.block_id_to_btnode[self.R_mining_head]
-        while old_head is not joint:
-            self.remove_R_block(old_head.block)
-            old_head = old_head.parent_btnode
+        for block in R_table.path(self.R_mining_head, joint_id):
+            self.remove_R_block(block)
 
-        for btnode in reversed(new_branch):
-            self.add_R_block(btnode.block)
+        for block in reversed(R_table.path(new_block_id, joint_id)):
+            self.add_R_block(block)
 
         self.R_mining_head = new_block_id
         self.schedule_R_block_generation()
@@ -301,26 +946,23 @@ class Node:
             return
 
         parent_id = self.A_mining_heads[ack_chain_id]
-        parent_btnode = self.block_id_to_btnode[parent_id]
-        block_depth = parent_btnode.block.depth + 1
+        block_depth = self.sim.blocks.A.blocks[parent_id].depth + 1
 
         A_block = A_Block(self.sim.ID.new_A_block_id(), self.node_id, self.sim.cur_time, block_depth, parent_id,
                           ack_chain_id)
         A_block.size = 16 * 8
 
         for R_block in self.active_R_periods:
-            if ack_chain_id not in R_block.acks:
+            if not R_block.ack_flags[ack_chain_id]:
                 A_block.ack_for.append(('R', R_block))
             else:
-                for txn_block in R_block.txn_block_list:
-                    if ack_chain_id not in txn_block.acks:
-                        A_block.ack_for.append(('T', txn_block))
-                        A_block.size += 8 * 8
-                        break
+                cursor = R_block.ack_cursors[ack_chain_id]
+                if cursor < len(R_block.txn_block_list):
+                    A_block.ack_for.append(('T', R_block.txn_block_list[cursor]))
+                    A_block.size += 8 * 8
 
-        self.sim.P(self.node_id, 'A-block A' + str(A_block.block_id) + ' created (parent A' + str(
-            parent_id) + ') in ack_chain AC' + str(
-            ack_chain_id))
+        self.sim.blocks.A.add(A_block)
+        self.sim.log.record(TRACE.A_CREATED, self.node_id, A_block.block_id, parent_id, ack_chain_id)
 
         dummy_event = Event(-1, -1, -1, A_block)
         self.receive_A_block(dummy_event)
@@ -328,117 +970,142 @@ class Node:
     def receive_A_block(self, event):
         A_block = event.data
         ack_chain_id = A_block.ack_id
+        if event.sender != -1:  # a send, not genesis or this node's own block
+            A_block.in_flight -= 1
 
-        if A_block.block_id in self.received_A_blocks:
+        base = self.sim.blocks.A.finalized
+        if has_flag(self.A_flags, A_block.block_id, FLAG.SEEN, base):
             return
-        self.received_A_blocks.add(A_block.block_id)
+        set_flag(self.A_flags, A_block.block_id, FLAG.SEEN, base)
+        if self.inbound:
+            self.drop_inbound(CONST.RECEIVE_A_BLOCK, A_block.block_id)
 
         if self.process_A_block(event.data, A_block.ack_id):
             self.broadcast(CONST.RECEIVE_A_BLOCK, A_block.size, A_block, event.sender)
 
         if A_block.creator == -1:
-            self.sim.P(self.node_id, 'Setting Genesis A-block A' + str(A_block.block_id))
+            self.sim.log.record(TRACE.A_GENESIS, self.node_id, A_block.block_id)
         else:
-            self.sim.P(self.node_id, 'A-block A' + str(A_block.block_id) + ' received in ack_chain AC' + str(
-                ack_chain_id))
+            self.sim.log.record(TRACE.A_RECEIVED, self.node_id, A_block.block_id, ack_chain_id)
 
     def process_A_block(self, A_block, ack_chain_id):
         parent_id = A_block.parent_id
 
+        A_table = self.sim.blocks.A
         if parent_id == -1:  # Genesis block
-            new_btnode = BTNode(A_block, None)
-            self.block_id_to_btnode[A_block.block_id] = new_btnode
+            set_flag(self.A_flags, A_block.block_id, FLAG.ACCEPTED, A_table.finalized)
             self.switch_A_branch(A_block.block_id, ack_chain_id, True)
             return True
 
-        if parent_id not in self.block_id_to_btnode:
+        if parent_id < A_table.finalized:
+            # Only a retained block (a head or a recent ancestor of one) can still get children
+            retained = A_table.retained_flags.get(parent_id)
+            if retained is None or not retained[self.node_id] & FLAG.ACCEPTED:
+                return False
+        elif not has_flag(self.A_flags, parent_id, FLAG.ACCEPTED, A_table.finalized):
             return False
 
-        parent_btnode = self.block_id_to_btnode[parent_id]
-        if (parent_btnode.block.depth + 1) != A_block.depth:
+        A_blocks = A_table.blocks
+        parent_block = A_blocks[parent_id]
+        if (parent_block.depth + 1) != A_block.depth:
             return False
 
-        new_btnode = BTNode(A_block, parent_btnode)
-        self.block_id_to_btnode[A_block.block_id] = new_btnode
-        parent_btnode.children.append(new_btnode)
+        set_flag(self.A_flags, A_block.block_id, FLAG.ACCEPTED, A_table.finalized)
 
-        if self.block_id_to_btnode[self.A_mining_heads[ack_chain_id]].block.depth < A_block.depth:
+        if A_blocks[self.A_mining_heads[ack_chain_id]].depth < A_block.depth:
             self.switch_A_branch(A_block.block_id, ack_chain_id)
 
+        # Promotion itself happens in add_A_block when the last pending chain acks a block;
+        # here this node observes blocks that are fully acked and starts following them
         for type, block in A_block.ack_for:
+            if block.pending_acks:
+                continue
             if type == 'T':
                 txn_block = block
-                if len(txn_block.acks) == self.sim.ACK_CHAIN_COUNT:
-                    self.last_txn_block_to_follow = txn_block
-                    self.sim.P(self.node_id, 'TB' + str(txn_block.block_id) + ' became MustInclude')
-                    txn_block.R_block.mi_txn_blocks.add(txn_block)
-                    self.sim.confirmed_txn_count += txn_block.txn_count
-                    txn_block.txn_count = 0
-                    if txn_block.block_number < 3:
-                        self.sim.txn_block_delay[txn_block.block_number] += (
-                                self.sim.cur_time - txn_block.creation_time)
-                        self.sim.txn_block_delay_count[txn_block.block_number] += 1
+                self.last_txn_block_to_follow = txn_block
+                self.sim.log.record(TRACE.TXN_MUSTINCLUDE, self.node_id, txn_block.block_id)
+                delay = self.sim.cur_time - txn_block.creation_time
+                self.sim.metrics.record_txn_delay(txn_block.block_number, delay)
+                if txn_block.block_number < 3:
+                    self.sim.txn_block_delay[txn_block.block_number] += delay
+                    self.sim.txn_block_delay_count[txn_block.block_number] += 1
             else:
                 R_Block = block
-                if len(R_Block.acks) == self.sim.ACK_CHAIN_COUNT:
-                    self.sim.R_ACK_DELAY += (self.sim.cur_time - R_Block.creation_time)
-                    self.sim.R_ACK_DELAY_COUNT += 1
+                delay = self.sim.cur_time - R_Block.creation_time
+                self.sim.metrics.record_R_ack_delay(delay)
+                self.sim.R_ACK_DELAY += delay
+                self.sim.R_ACK_DELAY_COUNT += 1
 
         return True
 
     def switch_A_branch(self, new_block_id, ack_id, is_genesis=False):
+        A_table = self.sim.blocks.A
         if is_genesis:
-            self.add_A_block(self.block_id_to_btnode[new_block_id].block)
+            self.add_A_block(A_table.blocks[new_block_id])
             self.A_mining_heads[ack_id] = new_block_id
             return
 
-        old_head = self.block_id_to_btnode[self.A_mining_heads[ack_id]]
+        old_head_id = self.A_mining_heads[ack_id]
+        joint_id = A_table.common_ancestor(old_head_id, new_block_id)
 
-        if old_head.parent_btnode is None:
-            self.add_A_block(self.block_id_to_btnode[new_block_id].block)
-            self.A_mining_heads[ack_id] = new_block_id
+        for block in A_table.path(old_head_id, joint_id):
+            self.remove_A_block(block)
 
-        new_head = self.block_id_to_btnode[new_block_id]
-        old_branch = []
-        new_branch = []
-
-        while True:
-            if new_head in old_branch:
-                joint = new_head
-                break
-            else:
-                new_branch.append(new_head)
-                new_head = new_head.parent_btnode
-            if old_head:
-                old_branch.append(old_head)
-                old_head = old_head.parent_btnode
-
-        old_head = self.block_id_to_btnode[self.A_mining_heads[ack_id]]
-        while old_head is not joint:
-            self.remove_A_block(old_head.block)
-            old_head = old_head.parent_btnode
-
-        for btnode in reversed(new_branch):
-            self.add_A_block(btnode.block)
+        for block in reversed(A_table.path(new_block_id, joint_id)):
+            self.add_A_block(block)
 
         self.A_mining_heads[ack_id] = new_block_id
         if self.scheduled_next_block_generation_ack_id == ack_id:
             self.schedule_A_block_generation()
 
     def add_A_block(self, A_block):
+        ack_id = A_block.ack_id
         for type, block in A_block.ack_for:
-            block.acks.add(A_block.ack_id)
+            if block.ack_flags[ack_id]:
+                continue
+            block.ack_flags[ack_id] = 1
+            block.pending_acks -= 1
+
+            if type == 'T':
+                R_block = block.R_block
+                cursor = R_block.ack_cursors[ack_id]
+                if cursor == block.block_number:
+                    # A Txn_Range is scanned through its materialised blocks: one not yet created is unacked
+                    blocks = getattr(R_block.txn_block_list, 'blocks', R_block.txn_block_list)
+                    while cursor < len(blocks) and blocks[cursor] is not None and blocks[cursor].ack_flags[ack_id]:
+                        cursor += 1
+                    R_block.ack_cursors[ack_id] = cursor
+
+                if block.pending_acks == 0:
+                    self.promote_txn_block(block)
 
     def remove_A_block(self, A_block):
+        ack_id = A_block.ack_id
         for type, block in A_block.ack_for:
-            if A_block.ack_id in block.acks:
-                block.acks.remove(A_block.ack_id)
+            if not block.ack_flags[ack_id]:
+                continue
+            block.ack_flags[ack_id] = 0
+            block.pending_acks += 1
+
+            if type == 'T':
+                R_block = block.R_block
+                if block.block_number < R_block.ack_cursors[ack_id]:
+                    R_block.ack_cursors[ack_id] = block.block_number
+
+    def promote_txn_block(self, txn_block):
+        # Acked on every chain: the txn block becomes MustInclude and its txns are confirmed once
+        txn_block.R_block.mi_txn_blocks.add(txn_block)
+        self.sim.confirmed_txn_count += txn_block.txn_count
+        self.sim.metrics.record_confirmed(txn_block.txn_count)
+        txn_block.txn_count = 0
 
     def receive_txn_block(self, event):
         txn_block = event.data
-        if txn_block.block_id in self.received_Txn_blocks:
+        if has_flag(self.T_flags, txn_block.block_id, FLAG.SEEN):
             return
-        self.received_Txn_blocks.add(txn_block.block_id)
+        set_flag(self.T_flags, txn_block.block_id, FLAG.SEEN)
+        if self.inbound:
+            self.drop_inbound(CONST.RECEIVE_TXN_BLOCK, txn_block.block_id)
 
         if self.process_txn_block(event.data):
             self.broadcast(CONST.RECEIVE_TXN_BLOCK, txn_block.size, txn_block, event.sender)
@@ -446,53 +1113,404 @@ class Node:
     def process_txn_block(self, txn_block):
         parent_id = txn_block.parent_id
         if parent_id == -1:  # Genesis block
-            new_btnode = BTNode(txn_block, None)
-            self.block_id_to_btnode[txn_block.block_id] = new_btnode
+            set_flag(self.T_flags, txn_block.block_id, FLAG.ACCEPTED)
             self.last_txn_block_to_follow = txn_block
             return True
+        if self.sim.lazy_txn_blocks:
+            return self.process_txn_range(txn_block)
 
-        if parent_id not in self.block_id_to_btnode:
+        if not has_flag(self.T_flags, parent_id, FLAG.ACCEPTED):
             return False
 
         R_block = txn_block.R_block
         if R_block not in self.active_R_periods:
             return False
 
-        parent_btnode = self.block_id_to_btnode[parent_id]
-        if (parent_btnode.block.depth + 1) != txn_block.depth:
+        if (self.sim.blocks.T.blocks[parent_id].depth + 1) != txn_block.depth:
             return False
 
-        new_btnode = BTNode(txn_block, parent_btnode)
-        self.block_id_to_btnode[txn_block.block_id] = new_btnode
-        parent_btnode.children.append(new_btnode)
+        set_flag(self.T_flags, txn_block.block_id, FLAG.ACCEPTED)
 
-        self.sim.P(self.node_id, 'Txn block T' + str(txn_block.block_id) + ' received')
+        self.sim.log.record(TRACE.TXN_RECEIVED, self.node_id, txn_block.block_id)
         return True
 
+    def process_txn_range(self, txn_range):
+        # The blocks of a range arrive and are accepted together, so only the flags of each
+        # range's first block id are used
+        if not has_flag(self.T_flags, txn_range.parent_base, FLAG.ACCEPTED):
+            return False
+
+        if txn_range.R_block not in self.active_R_periods:
+            return False
+
+        set_flag(self.T_flags, txn_range.block_id, FLAG.ACCEPTED)
+
+        for block_id in range(txn_range.block_id, txn_range.block_id + txn_range.count):
+            self.sim.log.record(TRACE.TXN_RECEIVED, self.node_id, block_id)
+        return True
+
+
+HANDLERS = {
+    CONST.CREATE_R_BLOCK: Node.create_R_block,
+    CONST.RECEIVE_R_BLOCK: Node.receive_R_block,
+    CONST.CREATE_A_BLOCK: Node.create_A_block,
+    CONST.RECEIVE_A_BLOCK: Node.receive_A_block,
+    CONST.CREATE_TXN_BLOCK: Node.create_txn_block,
+    CONST.RECEIVE_TXN_BLOCK: Node.receive_txn_block,
+}
+
+EVENT_NAMES = {value: name for name, value in vars(CONST).items() if not name.startswith('_')}
+
+
+class Profiler:
+    # Opt-in (--profile) instrumentation of the dispatch loop. Events are classified before
+    # they are handled: RECEIVE_* events for blocks the receiver has already seen are
+    # duplicates, CREATE_* events whose mining head has moved on are stale.
+    def __init__(self, sim):
+        self.sim = sim
+        self.dispatched = dict.fromkeys(HANDLERS, 0)
+        self.handler_time = dict.fromkeys(HANDLERS, 0.0)
+        self.early_returns = dict.fromkeys(HANDLERS, 0)
+        self.peak_queue_length = 0
+        self.fanout = {}
+
+    def is_early_return(self, node, event):
+        type = event.type
+        if type == CONST.RECEIVE_A_BLOCK:
+            return has_flag(node.A_flags, event.data.block_id, FLAG.SEEN, self.sim.blocks.A.finalized)
+        if type == CONST.RECEIVE_TXN_BLOCK:
+            return has_flag(node.T_flags, event.data.block_id, FLAG.SEEN)
+        if type == CONST.RECEIVE_R_BLOCK:
+            return has_flag(node.R_flags, event.data.block_id, FLAG.SEEN)
+        if type == CONST.CREATE_A_BLOCK:
+            prev_mining_head, ack_chain_id = event.data
+            return node.A_mining_heads[ack_chain_id] != prev_mining_head
+        if type == CONST.CREATE_R_BLOCK:
+            return node.R_mining_head != event.data
+        return False
+
+    def dispatch(self, event):
+        queue_length = len(self.sim.event_queue) + 1
+        if queue_length > self.peak_queue_length:
+            self.peak_queue_length = queue_length
+
+        node = self.sim.nodes[event.receiver]
+        if self.is_early_return(node, event):
+            self.early_returns[event.type] += 1
+
+        start = perf_counter()
+        HANDLERS[event.type](node, event)
+        self.handler_time[event.type] += perf_counter() - start
+        self.dispatched[event.type] += 1
+
+    def record_fanout(self, count):
+        self.fanout[count] = self.fanout.get(count, 0) + 1
+
+    def summary(self):
+        return {
+            'events': {EVENT_NAMES[type]: {'dispatched': self.dispatched[type],
+                                           'handler_time': self.handler_time[type],
+                                           'early_returns': self.early_returns[type]}
+                       for type in HANDLERS},
+            'peak_queue_length': self.peak_queue_length,
+            'cancelled_skipped': self.sim.event_queue.cancelled_skipped,
+            'suppressed_sends': self.sim.suppressed_sends,
+            'fanout': dict(sorted(self.fanout.items())),
+        }
+
+    def report(self):
+        print("Profile of the event dispatch loop")
+        print("{:<18} {:>12} {:>11} {:>10} {:>14} {:>8}".format('event', 'dispatched', 'handler s', 'us/event',
+                                                                 'early returns', 'wasted'))
+        for type in sorted(HANDLERS, key=lambda t: -self.dispatched[t]):
+            count = self.dispatched[type]
+            if count == 0:
+                continue
+            print("{:<18} {:>12} {:>11.3f} {:>10.2f} {:>14} {:>7.1%}".format(
+                EVENT_NAMES[type], count, self.handler_time[type], self.handler_time[type] / count * 1e6,
+                self.early_returns[type], self.early_returns[type] / count))
+        print("Peak event queue length {peak}, cancelled events skipped {cancelled}".format(
+            peak=self.peak_queue_length, cancelled=self.sim.event_queue.cancelled_skipped))
+        if self.sim.gossip_dedup:
+            print("Sends suppressed by gossip dedup {suppressed}".format(suppressed=self.sim.suppressed_sends))
+        print("Broadcast fan-out histogram (neighbours: broadcasts) " +
+              ' '.join('{k}:{v}'.format(k=k, v=v) for k, v in sorted(self.fanout.items())))
+
+
+class LatencyHistogram:
+    # Fixed-memory log-linear histogram (HDR style) of millisecond latencies. Each power-of-two
+    # range is split into SUB_BUCKETS linear buckets, so percentiles are within ~1.6% of the
+    # exact value whatever the number of samples.
+    SUB_BUCKETS = 64
+    MAX_EXPONENT = 48
+
+    def __init__(self):
+        self.counts = np.zeros(self.MAX_EXPONENT * self.SUB_BUCKETS, dtype=np.int64)
+        self.total = 0
+        self.sum = 0.0
+
+    def bucket(self, value):
+        if value < 1:
+            return 0
+        mantissa, exponent = math.frexp(value)
+        index = (exponent - 1) * self.SUB_BUCKETS + int((mantissa * 2 - 1) * self.SUB_BUCKETS)
+        return min(index, len(self.counts) - 1)
+
+    def bucket_value(self, index):
+        exponent, sub_bucket = divmod(index, self.SUB_BUCKETS)
+        return (2 ** exponent) * (1 + (sub_bucket + 0.5) / self.SUB_BUCKETS)
+
+    def add(self, value):
+        self.counts[self.bucket(value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.total += other.total
+        self.sum += other.sum
+
+    def reset(self):
+        self.counts[:] = 0
+        self.total = 0
+        self.sum = 0.0
+
+    def mean(self):
+        return self.sum / self.total if self.total else 0
+
+    def percentile(self, q):
+        if self.total == 0:
+            return 0
+        target = max(1, int(math.ceil(q / 100 * self.total)))
+        index = int(np.searchsorted(np.cumsum(self.counts), target))
+        return self.bucket_value(index)
+
+
+# Two-sided 95% Student t quantiles by degrees of freedom; beyond the table the normal quantile is close enough
+T_QUANTILES_95 = [math.inf, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179,
+                  2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056,
+                  2.052, 2.048, 2.045, 2.042]
+
+
+def t_quantile_95(dof):
+    return T_QUANTILES_95[dof] if dof < len(T_QUANTILES_95) else 1.960
+
+
+class Metrics:
+    # Streams samples into fixed-memory histograms as they happen. Every metrics window of
+    # simulated time is summarised (TPS, confirmation and R-ack latency percentiles) and, when
+    # --metrics_out is given, appended to a JSON-lines or CSV sink.
+    WINDOW_FIELDS = ['window_start', 'window_end', 'confirmed_txns', 'tps', 'txn_delay_samples', 'txn_delay_p50',
+                     'txn_delay_p99', 'R_ack_samples', 'R_ack_delay_p50', 'R_ack_delay_p99']
+    CI_BATCHES = 10
+    CI_T_QUANTILE = t_quantile_95(CI_BATCHES - 1)
+
+    def __init__(self, window, out_path=None):
+        self.window = window
+        self.window_start = 0
+        self.window_end = window
+        self.out_path = None
+        self.sink_offset = 0
+
+        self.txn_delay = {}  # block_number -> LatencyHistogram over the whole run
+        self.R_ack_delay = LatencyHistogram()
+        self.window_txn_delay = LatencyHistogram()
+        self.window_R_ack_delay = LatencyHistogram()
+        self.window_confirmed = 0
+        self.window_tps = []
+        self.window_txn_delay_sums = []  # per-window sums and counts, for batch means of the delays
+        self.window_txn_delay_counts = []
+        self.window_R_ack_sums = []
+        self.window_R_ack_counts = []
+
+        self.sink = None
+        self.csv_writer = None
+        self.open_sink(out_path, 'w')
+
+    def open_sink(self, out_path, mode):
+        self.out_path = out_path
+        if out_path is None:
+            return
+        self.sink = open(out_path, mode, newline='')
+        if out_path.endswith('.csv'):
+            self.csv_writer = csv.DictWriter(self.sink, fieldnames=self.WINDOW_FIELDS)
+            if mode == 'w':
+                self.csv_writer.writeheader()
+
+    def prepare_checkpoint(self):
+        if self.sink is not None:
+            self.sink.flush()
+            self.sink_offset = os.fstat(self.sink.fileno()).st_size
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['sink'] = None
+        state['csv_writer'] = None
+        return state
+
+    def reopen(self, out_path, resume=True):
+        if resume and out_path is not None and out_path == self.out_path and os.path.exists(out_path):
+            truncate_file(out_path, self.sink_offset)
+            self.open_sink(out_path, 'a')
+        else:
+            self.open_sink(out_path, 'w')
+
+    def record_txn_delay(self, block_number, delay):
+        histogram = self.txn_delay.get(block_number)
+        if histogram is None:
+            histogram = self.txn_delay[block_number] = LatencyHistogram()
+        histogram.add(delay)
+        self.window_txn_delay.add(delay)
+
+    def record_R_ack_delay(self, delay):
+        self.R_ack_delay.add(delay)
+        self.window_R_ack_delay.add(delay)
+
+    def record_confirmed(self, txn_count):
+        self.window_confirmed += txn_count
+
+    def roll(self, now):
+        # Close every window that ends at or before now
+        while now >= self.window_end:
+            self.emit(self.window_end)
+            self.window_start = self.window_end
+            self.window_end += self.window
+
+    def emit(self, window_end):
+        length = (window_end - self.window_start) / 1000
+        if length <= 0:
+            return
+        tps = self.window_confirmed / length
+        self.window_tps.append(tps)
+        self.window_txn_delay_sums.append(self.window_txn_delay.sum)
+        self.window_txn_delay_counts.append(self.window_txn_delay.total)
+        self.window_R_ack_sums.append(self.window_R_ack_delay.sum)
+        self.window_R_ack_counts.append(self.window_R_ack_delay.total)
+
+        if self.sink is not None:
+            row = {
+                'window_start': self.window_start / 1000,
+                'window_end': window_end / 1000,
+                'confirmed_txns': self.window_confirmed,
+                'tps': tps,
+                'txn_delay_samples': self.window_txn_delay.total,
+                'txn_delay_p50': self.window_txn_delay.percentile(50) / 1000,
+                'txn_delay_p99': self.window_txn_delay.percentile(99) / 1000,
+                'R_ack_samples': self.window_R_ack_delay.total,
+                'R_ack_delay_p50': self.window_R_ack_delay.percentile(50) / 1000,
+                'R_ack_delay_p99': self.window_R_ack_delay.percentile(99) / 1000,
+            }
+            if self.csv_writer is not None:
+                self.csv_writer.writerow(row)
+            else:
+                self.sink.write(json.dumps(row) + '\n')
+
+        self.window_confirmed = 0
+        self.window_txn_delay.reset()
+        self.window_R_ack_delay.reset()
+
+    def close(self, end_time):
+        self.roll(end_time)
+        self.emit(end_time)
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+
+    def warmup_windows(self):
+        # MSER-5: truncate the d leading windows (in batches of 5) that minimise the marginal
+        # standard error of the remaining per-window TPS
+        series = np.array(self.window_tps)
+        batch = 5
+        n_batches = len(series) // batch
+        if n_batches < 2:
+            return 0
+        means = series[:n_batches * batch].reshape(n_batches, batch).mean(axis=1)
+        best_d, best_stat = 0, None
+        for d in range(n_batches // 2 + 1):
+            rest = means[d:]
+            stat = ((rest - rest.mean()) ** 2).sum() / len(rest) ** 2
+            if best_stat is None or stat < best_stat:
+                best_d, best_stat = d, stat
+        return best_d * batch
+
+    def confidence_intervals(self, min_batch_windows=1):
+        # Batch means: the most recent windows after the MSER-5 warm-up are split into CI_BATCHES
+        # contiguous batches, long enough that their means are close to independent. Returns
+        # {metric: (estimate, relative 95% half-width)}, or None while there are too few windows.
+        batch = (len(self.window_tps) - self.warmup_windows()) // self.CI_BATCHES
+        if batch < min_batch_windows:
+            return None
+        start = len(self.window_tps) - batch * self.CI_BATCHES
+
+        def batch_sums(series):
+            return np.array(series[start:]).reshape(self.CI_BATCHES, batch).sum(axis=1)
+
+        batch_means = {
+            'tps': batch_sums(self.window_tps) / batch,
+            'txn_block_delay': batch_sums(self.window_txn_delay_sums) / 1000,
+            'R_ack_delay': batch_sums(self.window_R_ack_sums) / 1000,
+        }
+        txn_counts = batch_sums(self.window_txn_delay_counts)
+        R_ack_counts = batch_sums(self.window_R_ack_counts)
+        if txn_counts.min() == 0 or R_ack_counts.min() == 0:
+            return None
+        batch_means['txn_block_delay'] /= txn_counts
+        batch_means['R_ack_delay'] /= R_ack_counts
+
+        intervals = {}
+        for name, means in batch_means.items():
+            estimate = means.mean()
+            half_width = self.CI_T_QUANTILE * means.std(ddof=1) / math.sqrt(self.CI_BATCHES)
+            intervals[name] = (estimate, half_width / estimate if estimate else math.inf)
+        return intervals
+
+    def summary(self):
+        all_txn_delay = LatencyHistogram()
+        for histogram in self.txn_delay.values():
+            all_txn_delay.merge(histogram)
+        result = {
+            'txn_block_delay_p50': all_txn_delay.percentile(50) / 1000,
+            'txn_block_delay_p99': all_txn_delay.percentile(99) / 1000,
+            'R_ack_delay_p50': self.R_ack_delay.percentile(50) / 1000,
+            'R_ack_delay_p99': self.R_ack_delay.percentile(99) / 1000,
+            'warmup_end': self.warmup_windows() * self.window / 1000,
+        }
+        for block_number in sorted(self.txn_delay):
+            histogram = self.txn_delay[block_number]
+            result['txn_block_delay_{n}_p50'.format(n=block_number + 1)] = histogram.percentile(50) / 1000
+            result['txn_block_delay_{n}_p99'.format(n=block_number + 1)] = histogram.percentile(99) / 1000
+        return result
+
+
+class RunResult:
+    # What Sim.run returns: the arguments of the run and its metrics as plain dicts, so results can
+    # be stored or serialised without parsing the text results file
+    def __init__(self, name, params, metrics, wall_time):
+        self.name = name
+        self.params = params
+        self.metrics = metrics
+        self.wall_time = wall_time
+
 
 class Sim:
-    def __init__(self, args):
+    ARRIVAL_PROFILE_BYTES = 256 * 1024 * 1024  # memory budget of the --gossip fast path cache
+    FAST_ARRIVALS_PURGE_MIN = 64
 
-        self.NODE_COUNT = args.N
-        self.TXN_BLOCK_SIZE = args.TBS * 1024 * 8
-        self.R_INTERARRIVAL_TIME = args.IAR * 1000
-        self.R_MEAN_BLOCK_TIME = (self.R_INTERARRIVAL_TIME * self.NODE_COUNT)
-        self.ACK_CHAIN_COUNT = args.AC
-        self.A_INTERARRIVAL_TIME = args.IAA * 1000
-        self.A_MEAN_BLOCK_TIME = (self.A_INTERARRIVAL_TIME * self.NODE_COUNT) / self.ACK_CHAIN_COUNT
+    def __init__(self, args, topology=None):
+        self.configure(args)
 
         self.ID = ID()
+        self.blocks = BlockStore()
+        self.rng = RNG(args.seed)
+        self.log = EventLog(self, args.log_level, args.trace)
 
         self.nodes = []
         for id in range(self.NODE_COUNT):
             self.nodes.append(Node(id, self))
 
-        self.event_queue = PriorityQueue()
+        self.event_queue = EventScheduler()
         self.cur_time = 0
-        self.end_time = args.duration * 60 * 1000
         self.confirmed_txn_count = 0
-        self.args = args
-        self.ALL_R_blocks = []
         self.avg_txn_size = 150 * 8
 
         self.R_ACK_DELAY = 0
@@ -500,39 +1518,282 @@ class Sim:
 
         self.txn_block_delay = [0 for _ in range(3)]
         self.txn_block_delay_count = [0 for _ in range(3)]
+        self.metrics = Metrics(args.metrics_window * 1000, args.metrics_out)
+
+        self.event_counts = [0] * (CONST.RECEIVE_A_BLOCK + 1)  # dispatched events, indexed by CONST type
+        self.profiler = Profiler(self) if args.profile else None
+        self.suppressed_sends = 0
+        self.pruned_A_blocks = 0
+        self.topology = topology  # built in setup() unless shared by the caller (see run_replications)
+        self.arrival_profiles = {}  # --gossip fast: (creator, size class) -> arrivals, least recently used first
+        self.fast_arrivals = {}  # --gossip fast: (event type, block id) -> (last arrival, arrival time per node)
+        self.fast_arrivals_purge_at = self.FAST_ARRIVALS_PURGE_MIN
+        self.checkpoint_pid = None
+
+    def configure(self, args):
+        # Everything derived from the command line; re-run when a checkpoint is resumed or forked
+        self.args = args
+        self.NODE_COUNT = args.N
+        self.TXN_BLOCK_SIZE = args.TBS * 1024 * 8
+        self.R_INTERARRIVAL_TIME = args.IAR * 1000
+        self.R_MEAN_BLOCK_TIME = (self.R_INTERARRIVAL_TIME * self.NODE_COUNT)
+        self.ACK_CHAIN_COUNT = args.AC
+        self.A_INTERARRIVAL_TIME = args.IAA * 1000
+        self.A_MEAN_BLOCK_TIME = (self.A_INTERARRIVAL_TIME * self.NODE_COUNT) / self.ACK_CHAIN_COUNT
+        self.end_time = args.duration * 60 * 1000
+        self.gossip_dedup = args.gossip == 'dedup'
+        self.gossip_fast = args.gossip == 'fast'
+        self.link_contention = args.links == 'contention'
+        self.lazy_txn_blocks = args.txn_blocks == 'lazy'
+        if self.gossip_fast and self.link_contention:
+            raise ValueError('--links contention models hop-by-hop sends and cannot be used with --gossip fast')
+        self.arrival_profile_limit = max(16, self.ARRIVAL_PROFILE_BYTES // (32 * self.NODE_COUNT))
+
+        # With --until_converged, --duration is only a cap: the run stops at the first metrics
+        # window boundary where every CI is narrow enough. A batch has to span at least one R
+        # period, otherwise neighbouring batch means are strongly correlated.
+        self.ci_target = args.ci_target if args.until_converged else None
+        self.min_batch_windows = max(1, math.ceil(self.R_INTERARRIVAL_TIME / (args.metrics_window * 1000)))
+        self.converged = False
+        if args.finality_depth < 0 or args.finality_depth == 1:
+            raise ValueError('--finality_depth must be 0 (no pruning) or at least 2')
+        self.finality_depth = args.finality_depth
+        if args.topology == 'file' and args.topology_file is None:
+            raise ValueError('--topology file needs --topology_file')
+
+        self.checkpoint_path = None
+        self.checkpoint_interval = args.checkpoint_every * 60 * 1000
+        if args.checkpoint_dir is not None:
+            os.makedirs(args.checkpoint_dir, exist_ok=True)
+            self.checkpoint_path = os.path.join(args.checkpoint_dir, run_name(args) + '.ckpt')
+        cur_time = getattr(self, 'cur_time', 0)
+        self.next_checkpoint_time = (cur_time // self.checkpoint_interval + 1) * self.checkpoint_interval
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['args'] = None
+        state['checkpoint_pid'] = None
+        # --gossip fast caches: path profiles are recomputed on demand, and only blocks still
+        # arriving somewhere can be overtaken, so everything else is left out of the checkpoint
+        state['arrival_profiles'] = {}
+        state['fast_arrivals'] = {key: entry for key, entry in self.fast_arrivals.items() if entry[0] > self.cur_time}
+        return state
+
+    @classmethod
+    def from_checkpoint(cls, path, parser, fork=False, argv=None):
+        # Arguments stored in the checkpoint become the defaults, so only flags given on this
+        # command line change anything. A fork never inherits the parent's output files: only a
+        # resumed run may continue (and truncate) them.
+        header, sim = load_checkpoint(path)
+        parser.set_defaults(**header['args'])
+        if fork:
+            parser.set_defaults(trace=None, metrics_out=None)
+        args = config_from_args(parser.parse_args(argv))
+        check_config(parser, args)
+        for key in ('N', 'AC', 'txn_blocks'):
+            if getattr(args, key) != header['args'].get(key, parser.get_default(key)):
+                parser.error('--{key} cannot change when resuming from a checkpoint'.format(key=key))
+        if fork:
+            for key in ('trace', 'metrics_out'):
+                own_path, parent_path = getattr(args, key), header['args'].get(key)
+                if own_path is not None and parent_path is not None and \
+                        os.path.abspath(own_path) == os.path.abspath(parent_path):
+                    parser.error('--{key} of a fork must differ from the checkpointed run\'s'.format(key=key))
+            if args.seed is not None and args.seed != header['args']['seed']:
+                sim.rng = RNG(args.seed)
+
+        sim.configure(args)
+        if fork and sim.checkpoint_path is not None and os.path.abspath(sim.checkpoint_path) == os.path.abspath(path):
+            parser.error('a fork would overwrite {path}; change a run parameter or --checkpoint_dir'.format(path=path))
+        sim.log.reopen(args.log_level, args.trace, resume=not fork)
+        sim.metrics.reopen(args.metrics_out, resume=not fork)
+        if args.profile and sim.profiler is None:
+            sim.profiler = Profiler(sim)
+        elif not args.profile:
+            sim.profiler = None
+        print("Loaded checkpoint {path} at {time:.0f} simulated secs".format(path=path, time=sim.cur_time / 1000))
+        return sim
+
+    def checkpoint(self, background=True):
+        self.log.prepare_checkpoint()
+        self.metrics.prepare_checkpoint()
+
+        if self.checkpoint_pid is not None:
+            pid, status = os.waitpid(self.checkpoint_pid, os.WNOHANG)
+            if pid == 0:
+                return  # the previous checkpoint is still being written; skip this one
+            self.checkpoint_done(status)
+
+        if background and hasattr(os, 'fork'):
+            # The forked child sees a copy-on-write snapshot of the whole simulation and pickles
+            # it while the parent keeps simulating
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    save_checkpoint(self, self.checkpoint_path)
+                    status = 0
+                except BaseException:
+                    traceback.print_exc()
+                finally:
+                    os._exit(status)
+            self.checkpoint_pid = pid
+        else:
+            save_checkpoint(self, self.checkpoint_path)
+
+    def prune(self):
+        # Live tips are every node's heads and the A-blocks with copies still in flight. Future
+        # events only read a tip, the parent of a tip, or (when a node switches branch) blocks
+        # up to finality_depth below a tip, so those stay and every other object is dropped.
+        # A node stuck on a branch nobody extends only keeps its own short window alive. Only
+        # A-blocks are pruned: they outnumber R and txn blocks by two orders of magnitude.
+        A_table = self.blocks.A
+        blocks = A_table.blocks
+        depth = A_table.depth
+        parent = A_table.parent
+        base = A_table.finalized
+
+        heads = np.array([[node.A_mining_heads[ack_id] for ack_id in range(self.ACK_CHAIN_COUNT)]
+                          for node in self.nodes])
+        in_flight = [block_id for block_id in range(base, len(blocks)) if blocks[block_id].in_flight]
+        tips = np.unique(np.concatenate([heads.ravel(), np.array(in_flight, dtype=np.int64)]))
+        keep = set()
+        for _ in range(self.finality_depth + 1):
+            keep.update(tips.tolist())
+            tips = np.unique(parent[tips])
+            tips = tips[tips >= 0]
+
+        # Node flags only move past blocks with nothing in flight. Blocks kept for the deepest
+        # head of their chain are about to be read anyway, so the base stops there too rather
+        # than copying their flags aside; older kept blocks (stuck heads) are retained.
+        recent = (depth[heads].max(axis=0) - self.finality_depth).tolist()
+        upto = base
+        while upto < len(blocks):
+            block = blocks[upto]
+            if block.in_flight or (upto in keep and block.depth >= recent[block.ack_id]):
+                break
+            upto += 1
+        self.pruned_A_blocks += A_table.prune(upto, keep, self.nodes)
+
+    def arrival_profile(self, creator, size):
+        # Fastest-path arrivals from creator to every other reachable node, cached per (creator,
+        # size class). Sizes round up to a power of two, overestimating transmission time by less
+        # than 2x; R- and A-blocks are tiny next to txn blocks, whose size is usually exact.
+        size_class = 1 << max(0, int(size - 1).bit_length())
+        key = (creator, size_class)
+        profile = self.arrival_profiles.pop(key, None)
+        if profile is None:
+            delay, queue, hops = self.topology.shortest_paths(creator, size_class)
+            targets = np.flatnonzero((hops > 0) & np.isfinite(delay))
+            path_hops = hops[targets].astype(np.float64)
+            profile = (targets, delay[targets], path_hops, queue[targets] / path_hops)
+            if len(self.arrival_profiles) >= self.arrival_profile_limit:
+                del self.arrival_profiles[next(iter(self.arrival_profiles))]
+        self.arrival_profiles[key] = profile
+        return profile
+
+    def record_fast_arrivals(self, key, targets, times):
+        arrivals = np.full(self.NODE_COUNT, -np.inf)
+        arrivals[targets] = times
+        self.fast_arrivals[key] = (times.max() if len(times) else -np.inf, arrivals)
+
+        # Blocks that have reached every node can no longer be overtaken
+        if len(self.fast_arrivals) >= self.fast_arrivals_purge_at:
+            self.fast_arrivals = {key: entry for key, entry in self.fast_arrivals.items()
+                                  if entry[0] > self.cur_time}
+            self.fast_arrivals_purge_at = max(self.FAST_ARRIVALS_PURGE_MIN, 2 * len(self.fast_arrivals))
+
+    def check_convergence(self):
+        intervals = self.metrics.confidence_intervals(self.min_batch_windows)
+        if intervals is None:
+            return False
+        self.converged = all(half_width <= self.ci_target for _, half_width in intervals.values())
+        return self.converged
+
+    def wait_for_checkpoint(self):
+        if self.checkpoint_pid is not None:
+            _, status = os.waitpid(self.checkpoint_pid, 0)
+            self.checkpoint_done(status)
 
-    def P(self, node_id, msg):
-        print("Time : {time:.3f} | N{node_id} | {msg}".format(time=self.cur_time / 1000, node_id=node_id, msg=msg))
+    def checkpoint_done(self, status):
+        self.checkpoint_pid = None
+        if os.waitstatus_to_exitcode(status) != 0:
+            print('Writing checkpoint {path} failed (exit code {code})'.format(
+                path=self.checkpoint_path, code=os.waitstatus_to_exitcode(status)), file=sys.stderr)
 
     def create_genesis_blocks(self):
-        GR_block = R_Block(self.ID.new_R_block_id(), -1, 0, 0, -1)
-        Gtxn_blocks = Txn_Block(GR_block, self.ID.new_Txn_block_id(), -1, 0, 0, -1)
+        GR_block = R_Block(self.ID.new_R_block_id(), -1, 0, 0, -1, self.ACK_CHAIN_COUNT)
+        Gtxn_blocks = Txn_Block(GR_block, self.ID.new_Txn_block_id(), -1, 0, 0, -1, self.ACK_CHAIN_COUNT)
         Gack_blocks = []
         for ack_id in range(self.ACK_CHAIN_COUNT):
             ack_block = A_Block(self.ID.new_A_block_id(), -1, 0, 0, -1, ack_id)
             Gack_blocks.append(ack_block)
+
+        self.blocks.R.add(GR_block)
+        self.blocks.T.add(Gtxn_blocks)
+        for ack_block in Gack_blocks:
+            self.blocks.A.add(ack_block)
         return (GR_block, Gtxn_blocks, Gack_blocks)
 
+    def setup_topology(self):
+        self.topology = build_topology(self.args, self.rng, [node.max_link_speed for node in self.nodes])
+        return self.topology
+
     def setup(self):
         GR_block, Gtxn_blocks, Gack_blocks = self.create_genesis_blocks()
 
+        if self.topology is None:
+            self.setup_topology()
+        elif self.args.topology == 'random':
+            # The original graph is drawn from the simulation RNG. A replication on a shared graph
+            # draws its own one anyway (and drops it), so its stream matches a plain run's.
+            build_topology(self.args, self.rng, [node.max_link_speed for node in self.nodes])
+
         for node in self.nodes:
-            node.setup_connections()
+            node.build_link_arrays(self.topology)
             node.setup_genesis_blocks(GR_block, Gtxn_blocks, Gack_blocks)
             node.schedule_R_block_generation()
             node.schedule_A_block_generation()
 
-    def run(self):
-        self.setup()
+    def run(self, resume=False):
+        start = perf_counter()
+        if not resume:
+            self.setup()
+        profiler = self.profiler
+        metrics_boundary = self.metrics.window_end
+        checkpoint_boundary = self.next_checkpoint_time if self.checkpoint_path is not None else math.inf
 
         while True:
 
-            time, event = self.event_queue.get()
+            entry = self.event_queue.get()
+            if entry is None:
+                break
+            time, event = entry
             if time > self.end_time:
+                self.event_queue.unget()
                 break
+            if time >= metrics_boundary:
+                self.metrics.roll(time)
+                metrics_boundary = self.metrics.window_end
+                if self.finality_depth:
+                    self.prune()  # piggybacks on the metrics window, often enough to keep memory flat
+                if self.ci_target is not None and self.check_convergence():
+                    self.event_queue.unget()
+                    self.end_time = self.metrics.window_start
+                    break
+            if time >= checkpoint_boundary:
+                # Checkpoint between events: the event just taken goes back on the queue first
+                self.event_queue.unget()
+                self.next_checkpoint_time += self.checkpoint_interval
+                checkpoint_boundary = self.next_checkpoint_time
+                self.checkpoint()
+                continue
             self.cur_time = time
+            self.event_counts[event.type] += 1
 
-            if event.type == CONST.CREATE_R_BLOCK:
+            if profiler is not None:
+                profiler.dispatch(event)
+            elif event.type == CONST.CREATE_R_BLOCK:
                 self.nodes[event.receiver].create_R_block(event)
             elif event.type == CONST.RECEIVE_R_BLOCK:
                 self.nodes[event.receiver].receive_R_block(event)
@@ -547,61 +1808,218 @@ class Sim:
             elif event.type == CONST.RECEIVE_TXN_BLOCK:
                 self.nodes[event.receiver].receive_txn_block(event)
 
+        if self.checkpoint_path is not None:
+            # The final state, so the run can later be extended with a longer --duration
+            self.wait_for_checkpoint()
+            self.checkpoint(background=False)
+        self.log.close()
+        intervals = self.metrics.confidence_intervals(self.min_batch_windows)  # before the partial last window
+        self.metrics.close(self.end_time)
+        percentiles = self.metrics.summary()
+
         sum = 0
         si = 0
-        for R_block in self.ALL_R_blocks:
+        for R_block in self.blocks.R.blocks[1:]:  # every R-block except genesis
             sum += len(R_block.mi_txn_blocks)
             si += 1
-        avg_mi_blocks = sum / si
+        avg_mi_blocks = sum / si if si else 0
 
-        print("Confirmed {confirmed} txns in {min} minutes".format(confirmed=self.confirmed_txn_count,
-                                                                   min=self.args.duration))
+        simulated_minutes = self.end_time / 60000
+        print("Confirmed {confirmed} txns in {min:g} minutes".format(confirmed=self.confirmed_txn_count,
+                                                                     min=simulated_minutes))
         tps = self.confirmed_txn_count / (self.end_time / 1000)
         print("Total Throughput : {tps:.2f} txns per sec".format(tps=tps))
         print("Avg. MustInclude blocks per R_block {ami:.2f}".format(ami=avg_mi_blocks))
 
-        avg_R_delay = (self.R_ACK_DELAY / self.R_ACK_DELAY_COUNT) / 1000
+        avg_R_delay = (self.R_ACK_DELAY / self.R_ACK_DELAY_COUNT) / 1000 if self.R_ACK_DELAY_COUNT else 0
 
         print("Avg. time between R_block creation and R-markers to appear on all A-chains {rdelay:.3f} secs".format(
             rdelay=avg_R_delay))
-        avg_t1 = (self.txn_block_delay[0] / self.txn_block_delay_count[0]) / 1000
-        avg_t2 = (self.txn_block_delay[1] / self.txn_block_delay_count[1]) / 1000
-        avg_t3 = (self.txn_block_delay[2] / self.txn_block_delay_count[2]) / 1000
+        avg_t1, avg_t2, avg_t3 = [(delay / count) / 1000 if count else 0
+                                  for delay, count in zip(self.txn_block_delay, self.txn_block_delay_count)]
         print("Avg. time between 1st Txn block creation and it becoming a MustInclude {t1:.3f} secs".format(t1=avg_t1))
         print("Avg. time between 2nd Txn block creation and it becoming a MustInclude {t2:.3f} secs".format(t2=avg_t2))
         print("Avg. time between 3rd Txn block creation and it becoming a MustInclude {t3:.3f} secs".format(t3=avg_t3))
-
-        output_file_name = "N_{nodes}_TBS_{block_size}_IAR_{Rinterarrival}_ack_{ackcount}_IAA_{Ainterarrival}_duration_{duration}".format(
-            nodes=args.N, block_size=args.TBS, Rinterarrival=args.IAR, ackcount=args.AC, Ainterarrival=args.IAA,
-            duration=self.args.duration)
-        f = open(output_file_name, 'w')
-        f.write(output_file_name + '\n')
-        f.write("Confirmed {confirmed} txns in {min} minutes\n".format(confirmed=self.confirmed_txn_count,
-                                                                       min=self.args.duration))
-        f.write("Total Throughput (txns per sec) | {tps:.2f}\n".format(tps=tps))
-        f.write("Avg. MustInclude blocks per R_block {ami:.2f}\n".format(ami=avg_mi_blocks))
-        f.write("Avg. time between R_block creation and R-markers to appear on all A-chains {rdelay:.3f} secs\n".format(
-            rdelay=avg_R_delay))
-        f.write(
-            "Avg. time between 1st Txn block creation and it becoming a MustInclude {t1:.3f} secs\n".format(t1=avg_t1))
-        f.write(
-            "Avg. time between 2nd Txn block creation and it becoming a MustInclude {t2:.3f} secs\n".format(t2=avg_t2))
-        f.write(
-            "Avg. time between 3rd Txn block creation and it becoming a MustInclude {t3:.3f} secs\n".format(t3=avg_t3))
-
-        f.close()
+        print("Txn block MustInclude delay p50 {p50:.3f} secs, p99 {p99:.3f} secs".format(
+            p50=percentiles['txn_block_delay_p50'], p99=percentiles['txn_block_delay_p99']))
+        print("R-marker ack delay p50 {p50:.3f} secs, p99 {p99:.3f} secs".format(
+            p50=percentiles['R_ack_delay_p50'], p99=percentiles['R_ack_delay_p99']))
+        print("Estimated warm-up period {warmup:.0f} secs".format(warmup=percentiles['warmup_end']))
+        if self.ci_target is not None:
+            if self.converged:
+                print("Converged to +-{target:.1%} after {min:g} minutes".format(target=self.ci_target,
+                                                                                 min=simulated_minutes))
+            else:
+                print("Did not converge to +-{target:.1%} within {min:g} minutes".format(target=self.ci_target,
+                                                                                        min=simulated_minutes))
+            if intervals is not None:
+                print("Steady-state TPS {tps:.2f} +-{tps_ci:.1%}, txn block delay {txn:.3f} secs +-{txn_ci:.1%}, "
+                      "R-marker ack delay {R:.3f} secs +-{R_ci:.1%} (95% batch-means CIs)".format(
+                          tps=intervals['tps'][0], tps_ci=intervals['tps'][1],
+                          txn=intervals['txn_block_delay'][0], txn_ci=intervals['txn_block_delay'][1],
+                          R=intervals['R_ack_delay'][0], R_ci=intervals['R_ack_delay'][1]))
+
+        if self.args.output_dir is not None:  # replications report through one consolidated file instead
+            output_file_name = run_name(self.args)
+            f = open(os.path.join(self.args.output_dir, output_file_name), 'w')
+            f.write(output_file_name + '\n')
+            f.write("Confirmed {confirmed} txns in {min:g} minutes\n".format(confirmed=self.confirmed_txn_count,
+                                                                             min=simulated_minutes))
+            f.write("Total Throughput (txns per sec) | {tps:.2f}\n".format(tps=tps))
+            f.write("Avg. MustInclude blocks per R_block {ami:.2f}\n".format(ami=avg_mi_blocks))
+            f.write("Avg. time between R_block creation and R-markers to appear on all A-chains {rdelay:.3f} "
+                    "secs\n".format(rdelay=avg_R_delay))
+            f.write("Avg. time between 1st Txn block creation and it becoming a MustInclude {t1:.3f} "
+                    "secs\n".format(t1=avg_t1))
+            f.write("Avg. time between 2nd Txn block creation and it becoming a MustInclude {t2:.3f} "
+                    "secs\n".format(t2=avg_t2))
+            f.write("Avg. time between 3rd Txn block creation and it becoming a MustInclude {t3:.3f} "
+                    "secs\n".format(t3=avg_t3))
+
+            f.close()
+
+        if self.profiler is not None:
+            self.profiler.report()
+
+        results = {
+            'confirmed_txns': self.confirmed_txn_count,
+            'tps': tps,
+            'avg_mi_blocks': avg_mi_blocks,
+            'avg_R_ack_delay': avg_R_delay,
+            'avg_txn_block_delay_1': avg_t1,
+            'avg_txn_block_delay_2': avg_t2,
+            'avg_txn_block_delay_3': avg_t3,
+            'simulated_minutes': simulated_minutes,
+            'converged': self.converged,
+            'pruned_A_blocks': self.pruned_A_blocks,
+        }
+        results.update(percentiles)
+        for name in ('tps', 'txn_block_delay', 'R_ack_delay'):
+            estimate, half_width = intervals[name] if intervals is not None else (math.nan, math.nan)
+            results['steady_' + name] = estimate
+            results['steady_' + name + '_ci'] = half_width
+
+        result = RunResult(run_name(self.args), dict(vars(self.args)), results, perf_counter() - start)
+        if self.args.results_db is not None:
+            store = ResultStore(self.args.results_db)
+            store.append(result)
+            store.close()
+        return result
+
+
+def run_name(args):
+    name = "N_{nodes}_TBS_{block_size}_IAR_{Rinterarrival}_ack_{ackcount}_IAA_{Ainterarrival}_duration_{duration}".format(
+        nodes=args.N, block_size=args.TBS, Rinterarrival=args.IAR, ackcount=args.AC,
+        Ainterarrival=args.IAA, duration=args.duration)
+    if args.seed is not None:
+        name += "_seed_{seed}".format(seed=args.seed)
+    # Non-default models are part of the name, so their results and checkpoints never collide
+    for key in ('gossip', 'links', 'txn_blocks'):
+        if getattr(args, key) != getattr(SimConfig, key):
+            name += "_{key}_{value}".format(key=key, value=getattr(args, key))
+    if args.topology == 'file':
+        name += "_topology_{file}".format(file=os.path.splitext(os.path.basename(args.topology_file))[0])
+    elif args.topology != SimConfig.topology:
+        name += "_topology_{topology}_degree_{degree}_latency_{latency}".format(
+            topology=args.topology, degree=args.degree, latency=args.latency)
+    return name
+
+
+CHECKPOINT_VERSION = 5
+
+
+def save_checkpoint(sim, path):
+    # A small header pickled ahead of the simulation state so it can be read on its own
+    header = {'version': CHECKPOINT_VERSION, 'sim_time': sim.cur_time, 'args': vars(sim.args)}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(sim, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    with open(path, 'rb') as f:
+        header = pickle.load(f)
+        if header.get('version') != CHECKPOINT_VERSION:
+            raise ValueError('{path} is checkpoint version {version}, expected {expected}'.format(
+                path=path, version=header.get('version'), expected=CHECKPOINT_VERSION))
+        sim = pickle.load(f)
+    return header, sim
+
+
+shared_topology = None  # set in each replication worker by init_replication_worker
+
+
+def init_replication_worker(topology):
+    global shared_topology
+    shared_topology = topology
+
+
+def run_replication(args):
+    start = perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = Sim(args, shared_topology).run()
+    return dict(result.metrics, seed=args.seed, wall_time=perf_counter() - start)
+
+
+def summarize_replications(rows):
+    # One row per replication, one column per metric; NaN cells (e.g. steady-state columns of
+    # runs that never had enough windows, or percentiles a run had no samples for) are left out
+    # of that metric's statistics
+    names = list(dict.fromkeys(name for row in rows for name in row))
+    table = np.array([[row.get(name, math.nan) for name in names] for row in rows], dtype=np.float64)
+    valid = ~np.isnan(table)
+    counts = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(valid, table, 0).sum(axis=0) / counts
+        variances = (np.where(valid, table - means, 0) ** 2).sum(axis=0) / (counts - 1)
+        stds = np.sqrt(variances)
+        t = np.array([t_quantile_95(count - 1) if count > 1 else math.nan for count in counts])
+        half_widths = t * stds / np.sqrt(counts)
+    return {name: {'mean': float(means[i]), 'std': float(stds[i]), 'ci95': float(half_widths[i]),
+                   'replications': int(counts[i])}
+            for i, name in enumerate(names)}
+
+
+def run_replications(args, replications, workers=None):
+    # The topology is immutable, so it is built (or loaded from the cache) once and shared by
+    # every replication. Nodes, genesis blocks and all other mutable state are rebuilt per
+    # replication, each with its own seed.
+    start = perf_counter()
+    topology = Sim(args).setup_topology()
+    setup_time = perf_counter() - start
+
+    seeds = [args.seed + rep if args.seed is not None else None for rep in range(replications)]
+    jobs = []
+    for seed in seeds:
+        job_args = copy.copy(args)
+        job_args.seed = seed
+        job_args.output_dir = None
+        jobs.append(job_args)
+
+    workers = min(replications, workers or os.cpu_count())
+    print("Running {count} replications on {workers} workers (shared topology built in {setup:.2f} secs)".format(
+        count=replications, workers=workers, setup=setup_time))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_replication_worker,
+                             initargs=(topology,)) as executor:
+        rows = list(executor.map(run_replication, jobs))
+
+    summary = summarize_replications(rows)
+    for name in ('tps', 'avg_R_ack_delay', 'avg_txn_block_delay_1', 'avg_txn_block_delay_2', 'avg_txn_block_delay_3',
+                 'txn_block_delay_p50', 'txn_block_delay_p99', 'R_ack_delay_p50', 'R_ack_delay_p99'):
+        print("{name:<24} {mean:10.3f} +-{ci:.3f} (std {std:.3f})".format(
+            name=name, mean=summary[name]['mean'], ci=summary[name]['ci95'], std=summary[name]['std']))
+
+    path = os.path.join(args.output_dir, run_name(args) + "_replications_{count}.json".format(count=replications))
+    with open(path, 'w') as f:
+        json.dump({'args': vars(args), 'setup_time': setup_time, 'summary': summary, 'replications': rows}, f, indent=2)
+    print("Results of {count} replications written to {path} (95% CIs across replications)".format(
+        count=replications, path=path))
+    return summary, rows
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--N', help='Node count', default=128, type=int)
-    parser.add_argument('--TBS', help='Txn Block Size in KB', default=1024, type=int)
-    parser.add_argument('--IAR', help='Interarrival time for R-blocks in seconds', default=600, type=int)
-    parser.add_argument('--AC', help='Ack chain count', default=32, type=int)
-    parser.add_argument('--IAA', help='Interarrival time for A-blocks in seconds', default=10, type=int)
-    parser.add_argument('--duration', help='Simulation duration in minutes', default=300, type=int)
-
-    args = parser.parse_args()
-    sim = Sim(args)
-    sim.run()
-
+    main()
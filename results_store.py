@@ -0,0 +1,96 @@
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+
+# Parameter columns are indexed for dashboard queries; every other argument is kept in the args JSON
+PARAM_COLUMNS = [('N', 'INTEGER'), ('TBS', 'INTEGER'), ('IAR', 'INTEGER'), ('AC', 'INTEGER'), ('IAA', 'INTEGER'),
+                 ('duration', 'INTEGER'), ('seed', 'INTEGER'), ('gossip', 'TEXT'), ('links', 'TEXT'),
+                 ('txn_blocks', 'TEXT'), ('topology', 'TEXT'), ('degree', 'INTEGER'), ('latency', 'TEXT'),
+                 ('finality_depth', 'INTEGER'), ('until_converged', 'INTEGER'), ('ci_target', 'REAL')]
+METRIC_COLUMNS = ['confirmed_txns', 'tps', 'avg_mi_blocks', 'avg_R_ack_delay', 'avg_txn_block_delay_1',
+                  'avg_txn_block_delay_2', 'avg_txn_block_delay_3', 'txn_block_delay_p50', 'txn_block_delay_p99',
+                  'R_ack_delay_p50', 'R_ack_delay_p99', 'warmup_end', 'simulated_minutes', 'converged',
+                  'pruned_A_blocks', 'steady_tps', 'steady_tps_ci', 'steady_txn_block_delay',
+                  'steady_txn_block_delay_ci', 'steady_R_ack_delay', 'steady_R_ack_delay_ci']
+INDEXED_PARAMS = ['N', 'TBS', 'IAR', 'AC', 'IAA', 'duration', 'seed']
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorded_at REAL NOT NULL,
+    run_name TEXT NOT NULL,
+    wall_time REAL,
+    {params},
+    {metrics},
+    args TEXT NOT NULL,
+    metrics TEXT NOT NULL
+)'''.format(params=',\n    '.join('{name} {type}'.format(name=name, type=type) for name, type in PARAM_COLUMNS),
+            metrics=',\n    '.join('{name} REAL'.format(name=name) for name in METRIC_COLUMNS))
+
+
+class ResultStore:
+    # Append-only SQLite table with one row per finished run. WAL journaling plus a generous busy
+    # timeout let many sweep workers append to the same file at once; rows are never updated.
+    def __init__(self, path, timeout=60):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        with self.conn:
+            self.conn.execute(SCHEMA)
+            self.conn.execute('CREATE INDEX IF NOT EXISTS runs_params ON runs ({columns})'.format(
+                columns=', '.join(INDEXED_PARAMS)))
+
+    def append(self, result):
+        names = ['recorded_at', 'run_name', 'wall_time']
+        values = [time.time(), result.name, result.wall_time]
+        for name, _ in PARAM_COLUMNS:
+            names.append(name)
+            values.append(result.params.get(name))
+        for name in METRIC_COLUMNS:
+            names.append(name)
+            values.append(result.metrics.get(name))
+        names += ['args', 'metrics']
+        values += [json.dumps(result.params), json.dumps(result.metrics)]
+
+        with self.conn:
+            self.conn.execute('INSERT INTO runs ({names}) VALUES ({slots})'.format(
+                names=', '.join(names), slots=', '.join('?' * len(names))), values)
+
+    def rows(self, filters=None):
+        filters = filters or {}
+        query = 'SELECT * FROM runs'
+        if filters:
+            query += ' WHERE ' + ' AND '.join('{name} = ?'.format(name=name) for name in filters)
+        cursor = self.conn.execute(query + ' ORDER BY id', list(filters.values()))
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    def close(self):
+        self.conn.close()
+
+
+def parse_filters(specs):
+    columns = dict(PARAM_COLUMNS)
+    filters = {}
+    for spec in specs:
+        name, _, raw = spec.partition('=')
+        if name not in columns or not raw:
+            raise ValueError('Bad filter ' + spec + ' (expected NAME=VALUE with NAME a parameter column)')
+        filters[name] = {'INTEGER': int, 'REAL': float, 'TEXT': str}[columns[name]](raw)
+    return filters
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export runs from a results store as CSV')
+    parser.add_argument('db', help='Store written with mtp2_final.py --results_db or sweep.py')
+    parser.add_argument('--filter', help='Only runs with NAME=VALUE (repeatable)', nargs='*', default=[])
+    parser.add_argument('--columns', help='Columns to export (default: parameters and metrics)', nargs='*',
+                        default=['id', 'run_name', 'wall_time'] + [name for name, _ in PARAM_COLUMNS] + METRIC_COLUMNS)
+
+    args = parser.parse_args()
+    store = ResultStore(args.db)
+    writer = csv.DictWriter(sys.stdout, fieldnames=args.columns, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(store.rows(parse_filters(args.filter)))
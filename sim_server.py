@@ -0,0 +1,95 @@
+import argparse
+import contextlib
+import io
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.connection import Client, Listener
+
+from mtp import SimConfig
+from mtp2_final import Sim  # imported before the workers fork, so every run starts with a warm interpreter
+
+
+class RunTimeout(Exception):
+    pass
+
+
+def raise_timeout(signum, frame):
+    raise RunTimeout()
+
+
+def run_request(config, timeout=None):
+    if timeout:
+        signal.signal(signal.SIGALRM, raise_timeout)
+        signal.alarm(timeout)
+
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            result = Sim(SimConfig(**config)).run()
+    except RunTimeout:
+        return {'status': 'timeout', 'output': output.getvalue()}
+    finally:
+        if timeout:
+            signal.alarm(0)
+
+    return {'status': 'ok', 'name': result.name, 'params': result.params, 'metrics': result.metrics,
+            'wall_time': result.wall_time, 'output': output.getvalue()}
+
+
+class SimServer:
+    # Long-lived daemon for many short runs: a pool of forked workers that already have NumPy and
+    # the simulator imported, fed by clients (mtp.SimClient) over a Unix socket. Each connection
+    # is served by its own thread, so W clients keep W workers busy.
+    def __init__(self, address, workers):
+        self.address = address
+        self.workers = workers or os.cpu_count()
+        self.stopping = False
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('fork'))
+        # With fork, the first submit starts every worker; do it here rather than from a connection thread
+        self.executor.submit(int).result()
+
+    def serve(self):
+        with Listener(self.address, family='AF_UNIX') as listener:
+            print('Serving on {address} with {workers} workers'.format(address=self.address, workers=self.workers),
+                  flush=True)
+            try:
+                while not self.stopping:
+                    conn = listener.accept()
+                    threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+            finally:
+                self.executor.shutdown(cancel_futures=True)
+
+    def handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    return
+
+                if request.get('shutdown'):
+                    self.stopping = True
+                    Client(self.address, family='AF_UNIX').close()  # wake up accept() so serve() sees the flag
+                    return
+
+                try:
+                    response = self.executor.submit(run_request, request['config'], request.get('timeout')).result()
+                except Exception as e:
+                    response = {'status': 'error', 'error': repr(e)}
+                conn.send(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve simulation runs to mtp.py --server and sweep.py --server')
+    parser.add_argument('address', help='Unix socket path to listen on')
+    parser.add_argument('--workers', help='Worker processes (default: CPU count)', default=None, type=int)
+
+    args = parser.parse_args()
+    SimServer(args.address, args.workers).serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import argparse
+import contextlib
+import csv
+import hashlib
+import itertools
+import json
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import asdict
+from functools import partial
+
+from mtp import SimClient, SimConfig
+from mtp2_final import Sim
+from results_store import ResultStore
+
+PARAMS = ['N', 'TBS', 'IAR', 'AC', 'IAA', 'duration', 'seed']
+METRICS = ['confirmed_txns', 'tps', 'avg_mi_blocks', 'avg_R_ack_delay',
+           'avg_txn_block_delay_1', 'avg_txn_block_delay_2', 'avg_txn_block_delay_3', 'txn_block_delay_p50',
+           'txn_block_delay_p99', 'R_ack_delay_p50', 'R_ack_delay_p99', 'warmup_end', 'simulated_minutes',
+           'converged', 'steady_tps', 'steady_tps_ci', 'steady_txn_block_delay', 'steady_txn_block_delay_ci',
+           'steady_R_ack_delay', 'steady_R_ack_delay_ci', 'wall_time']
+# Shared options that change results; each combination keeps its runs in a directory of its own
+OPTIONS = ['topology', 'degree', 'latency', 'topology_file', 'until_converged', 'ci_target']
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def raise_timeout(signum, frame):
+    raise JobTimeout()
+
+
+def parse_grid(grid_specs):
+    # Each spec is KEY=v1,v2,... ; the grid is the cartesian product of all specs
+    keys = []
+    values = []
+    for spec in grid_specs:
+        key, _, raw = spec.partition('=')
+        if key not in PARAMS or not raw:
+            raise ValueError('Bad grid spec ' + spec + ' (expected KEY=v1,v2 with KEY in ' + ', '.join(PARAMS) + ')')
+        keys.append(key)
+        values.append([int(v) for v in raw.split(',')])
+    return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+
+def expand_jobs(configs, replications, base_seed):
+    defaults = asdict(SimConfig())
+    jobs = []
+    seen = set()
+    for config in configs:
+        for rep in range(replications):
+            params = {key: defaults[key] for key in PARAMS}
+            params.update(config)
+            if 'seed' not in config:
+                params['seed'] = base_seed + rep
+            elif rep > 0:
+                params['seed'] = config['seed'] + rep
+
+            name = job_name(params)
+            if name not in seen:
+                seen.add(name)
+                jobs.append(params)
+    return jobs
+
+
+def job_name(params):
+    return '_'.join('{key}_{value}'.format(key=key, value=params[key]) for key in PARAMS)
+
+
+def options_name(options):
+    defaults = asdict(SimConfig())
+    values = {key: (options or {}).get(key, defaults[key]) for key in OPTIONS}
+    if values['topology_file'] is not None:
+        values['topology_file'] = os.path.abspath(values['topology_file'])
+    digest = hashlib.sha1(json.dumps(values, sort_keys=True).encode()).hexdigest()[:12]
+    return '{topology}_{digest}'.format(topology=values['topology'], digest=digest)
+
+
+def run_job(params, runs_dir, timeout, options=None):
+    # options are Sim arguments shared by every job of the sweep
+    args = SimConfig(**dict(options or {}, **params))
+    args.output_dir = runs_dir
+
+    if timeout:
+        signal.signal(signal.SIGALRM, raise_timeout)
+        signal.alarm(timeout)
+
+    start = time.time()
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            result = Sim(args).run()
+    except JobTimeout:
+        return dict(params, status='timeout', wall_time=time.time() - start)
+    finally:
+        if timeout:
+            signal.alarm(0)
+
+    return dict(params, status='ok', wall_time=time.time() - start, **result.metrics)
+
+
+def run_remote_job(server, params, runs_dir, timeout, options=None):
+    # Same as run_job, on a sim_server.py daemon; the server enforces the timeout
+    config = SimConfig(**dict(options or {}, **params))
+    config.output_dir = runs_dir
+    start = time.time()
+    client = SimClient(server)
+    try:
+        response = client.run(config, timeout)
+    finally:
+        client.close()
+    if response['status'] != 'ok':
+        return dict(params, status=response['status'], wall_time=time.time() - start)
+    return dict(params, status='ok', wall_time=time.time() - start, **response['metrics'])
+
+
+def write_result(path, row):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(row, f)
+    os.replace(tmp_path, path)
+
+
+def write_table(path, rows):
+    rows = sorted(rows, key=lambda row: [row[key] for key in PARAMS])
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=PARAMS + METRICS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def sweep(jobs, out_dir, workers, timeout, options=None, server=None):
+    runs_dir = os.path.join(out_dir, 'runs', options_name(options))
+    os.makedirs(runs_dir, exist_ok=True)
+
+    rows = []
+    pending = []
+    for params in jobs:
+        result_path = os.path.join(runs_dir, job_name(params) + '.json')
+        if os.path.exists(result_path):
+            with open(result_path) as f:
+                rows.append(json.load(f))
+        else:
+            pending.append(params)
+
+    print('{total} configs, {done} already done in {runs_dir}, {todo} to run on {workers} workers'.format(
+        total=len(jobs), done=len(rows), runs_dir=runs_dir, todo=len(pending), workers=workers))
+
+    failed = []
+    if server is None:
+        executor, job = ProcessPoolExecutor(max_workers=workers), run_job
+    else:
+        # The daemon does the simulating; one thread per in-flight run is enough here
+        executor, job = ThreadPoolExecutor(max_workers=workers), partial(run_remote_job, server)
+    with executor:
+        futures = {executor.submit(job, params, runs_dir, timeout, options): params for params in pending}
+        for future in as_completed(futures):
+            params = futures[future]
+            name = job_name(params)
+            try:
+                row = future.result()
+            except Exception as e:
+                failed.append(name)
+                print('FAILED  ' + name + ' : ' + repr(e))
+                continue
+
+            if row['status'] != 'ok':
+                failed.append(name)
+                print('TIMEOUT ' + name)
+                continue
+
+            write_result(os.path.join(runs_dir, name + '.json'), row)
+            rows.append(row)
+            print('done    ' + name + ' ({wall:.1f}s, {tps:.2f} tps)'.format(wall=row['wall_time'], tps=row['tps']))
+
+    table_path = os.path.join(out_dir, 'results.csv')
+    write_table(table_path, rows)
+    print('{ok} results written to {path}, {failed} failed'.format(ok=len(rows), path=table_path, failed=len(failed)))
+    return rows, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run many Sim configurations across a process pool')
+    parser.add_argument('--grid', help='Grid spec KEY=v1,v2 (repeatable, cartesian product)', nargs='*', default=[])
+    parser.add_argument('--configs', help='JSON file with a list of config objects', default=None)
+    parser.add_argument('--replications', help='Runs per config, with consecutive seeds', default=1, type=int)
+    parser.add_argument('--seed', help='Base seed for configs that do not set one', default=0, type=int)
+    parser.add_argument('--workers', help='Worker processes', default=os.cpu_count(), type=int)
+    parser.add_argument('--timeout', help='Per-job timeout in seconds', default=None, type=int)
+    parser.add_argument('--out', help='Output directory', default='sweep_results')
+    parser.add_argument('--until_converged', help='Stop each run once its CIs are within --ci_target; '
+                                                  'duration becomes a cap', action='store_true')
+    parser.add_argument('--ci_target', help='Relative CI half-width for --until_converged', default=0.05, type=float)
+    parser.add_argument('--topology', help='Network graph for every job (see mtp2_final.py --help)', default='random')
+    parser.add_argument('--degree', help='Target mean degree of generated topologies', default=8, type=int)
+    parser.add_argument('--latency', help='Link latency model of generated topologies', default='uniform')
+    parser.add_argument('--topology_file', help='Edge list for --topology file', default=None)
+    parser.add_argument('--server', help='Submit runs to the sim_server.py daemon on this socket instead of '
+                                         'starting a local pool; --workers is then the number of runs in flight',
+                        default=None)
+
+    args = parser.parse_args()
+
+    configs = []
+    if args.configs:
+        with open(args.configs) as f:
+            configs.extend(json.load(f))
+    if args.grid:
+        configs.extend(parse_grid(args.grid))
+    if not configs:
+        parser.error('give at least one of --grid or --configs')
+
+    jobs = expand_jobs(configs, args.replications, args.seed)
+    # Generated topologies are cached under the sweep directory, so jobs sharing N and seed reuse one graph.
+    # Every worker also appends its run to the sweep's results store.
+    os.makedirs(args.out, exist_ok=True)
+    options = {'topology': args.topology, 'degree': args.degree, 'latency': args.latency,
+               'topology_file': args.topology_file, 'topology_cache': os.path.join(args.out, 'topologies'),
+               'results_db': os.path.join(args.out, 'results.db')}
+    ResultStore(options['results_db']).close()  # create the schema before workers race for it
+    if args.until_converged:
+        options.update(until_converged=True, ci_target=args.ci_target)
+    sweep(jobs, args.out, args.workers, args.timeout, options, args.server)
@@ -0,0 +1,37 @@
+import contextlib
+import io
+import os
+
+import mtp
+from mtp import SimConfig
+from mtp2_final import Sim, run_name
+
+
+def comparable(metrics):
+    # repr so the steady-state NaNs of a short run compare equal; pruning only changes memory
+    return {key: repr(value) for key, value in metrics.items() if key != 'pruned_A_blocks'}
+
+
+def run_metrics(tmp_path, **params):
+    config = dict(N=16, duration=60, seed=1, output_dir=str(tmp_path))
+    config.update(params)
+    with contextlib.redirect_stdout(io.StringIO()):
+        metrics = Sim(SimConfig(**config)).run().metrics
+    return comparable(metrics)
+
+
+def test_dedup_matches_flood(tmp_path):
+    assert run_metrics(tmp_path, gossip='dedup') == run_metrics(tmp_path, gossip='flood')
+
+
+def test_pruning_keeps_metrics(tmp_path):
+    assert run_metrics(tmp_path, finality_depth=32) == run_metrics(tmp_path, finality_depth=0)
+
+
+def test_resume_with_longer_duration_matches_full_run(tmp_path):
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    run_metrics(tmp_path, duration=30, checkpoint_dir=checkpoint_dir)
+    path = os.path.join(checkpoint_dir, run_name(SimConfig(N=16, duration=30, seed=1)) + '.ckpt')
+    with contextlib.redirect_stdout(io.StringIO()):
+        resumed = mtp.main(['--resume', path, '--duration', '60'])
+    assert comparable(resumed.metrics) == run_metrics(tmp_path)
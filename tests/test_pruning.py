@@ -0,0 +1,17 @@
+import contextlib
+import io
+
+from mtp import SimConfig
+from mtp2_final import Sim
+
+
+def test_pruning_keeps_up_on_long_runs(tmp_path):
+    # seed 4 leaves a node stuck on its own branch of one chain early on, which used to stop
+    # pruning for the rest of the run
+    sim = Sim(SimConfig(N=16, duration=300, seed=4, output_dir=str(tmp_path)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = sim.run()
+
+    A_table = sim.blocks.A
+    assert result.metrics['pruned_A_blocks'] > 0.9 * len(A_table)
+    assert sum(block is not None for block in A_table.blocks) < 0.1 * len(A_table)
@@ -0,0 +1,289 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+# Share of nodes per region and rough one-way speed-of-light delays between regions in ms
+REGIONS = ['north_america', 'south_america', 'europe', 'africa', 'asia', 'oceania']
+REGION_SHARES = [0.35, 0.05, 0.35, 0.02, 0.18, 0.05]
+REGION_LATENCY = np.array([
+    [20, 70, 45, 110, 90, 80],
+    [70, 20, 100, 160, 150, 150],
+    [45, 100, 15, 70, 100, 140],
+    [110, 160, 70, 30, 130, 190],
+    [90, 150, 100, 130, 30, 60],
+    [80, 150, 140, 190, 60, 20],
+], dtype=np.float64)
+
+MIN_SOL_DELAY = 10  # ms; every link keeps at least this latency, as the original random graph did
+MAX_SOL_DELAY = 500
+
+
+class Topology:
+    # Undirected graph in CSR form: the links of node i are entries indptr[i]:indptr[i + 1] of
+    # indices (neighbour ids), sol_delays (ms) and speeds (bits/sec). Every edge appears once
+    # in each direction with the same parameters. uplinks[i] is node i's total upload speed,
+    # never below the speed of any of its links.
+    FORMAT = 2
+
+    def __init__(self, indptr, indices, sol_delays, speeds, uplinks=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.sol_delays = sol_delays
+        self.speeds = speeds
+        self.edge_sources = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+        fastest_link = np.zeros(len(indptr) - 1)
+        np.maximum.at(fastest_link, self.edge_sources, speeds)
+        self.uplinks = fastest_link if uplinks is None else np.maximum(np.asarray(uplinks, dtype=np.float64),
+                                                                       fastest_link)
+
+    @property
+    def node_count(self):
+        return len(self.indptr) - 1
+
+    @classmethod
+    def from_edges(cls, node_count, src, dst, sol_delays, speeds, uplinks=None):
+        # Each node's links keep the order in which its edges were listed
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        both_src = np.empty(2 * len(src), dtype=np.int64)
+        both_dst = np.empty(2 * len(src), dtype=np.int64)
+        both_src[0::2] = src
+        both_src[1::2] = dst
+        both_dst[0::2] = dst
+        both_dst[1::2] = src
+        order = np.argsort(both_src, kind='stable')
+
+        indptr = np.zeros(node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(both_src, minlength=node_count), out=indptr[1:])
+        return cls(indptr, both_dst[order],
+                   np.repeat(np.asarray(sol_delays, dtype=np.float64), 2)[order],
+                   np.repeat(np.asarray(speeds, dtype=np.float64), 2)[order], uplinks)
+
+    def shortest_paths(self, source, size):
+        # Fastest paths from source for a message of size bits: label-correcting search that
+        # relaxes all edges leaving the current frontier at once. Returns per node the summed
+        # sol_delay + transmission time (inf if unreachable), the summed mean queueing delay of
+        # the links on that path (as in Node.link_queing_means) and the path's hop count.
+        weights = self.sol_delays + (size / self.speeds) * 1000
+        queue_means = ((96 * 1024) / self.speeds) * 1000
+        delay = np.full(self.node_count, np.inf)
+        queue = np.zeros(self.node_count)
+        hops = np.zeros(self.node_count, dtype=np.int64)
+        delay[source] = 0
+
+        frontier = np.array([source])
+        while len(frontier):
+            starts = self.indptr[frontier]
+            counts = self.indptr[frontier + 1] - starts
+            edges = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            heads = self.indices[edges]
+            candidate = delay[self.edge_sources[edges]] + weights[edges]
+            improves = candidate < delay[heads]
+            edges, heads, candidate = edges[improves], heads[improves], candidate[improves]
+
+            # Best candidate per head: sort by head, then delay, and keep the first of each run
+            order = np.lexsort((candidate, heads))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = heads[order[1:]] != heads[order[:-1]]
+            best = order[first]
+            frontier = heads[best]
+            tails = self.edge_sources[edges[best]]
+            delay[frontier] = candidate[best]
+            queue[frontier] = queue[tails] + queue_means[edges[best]]
+            hops[frontier] = hops[tails] + 1
+        return delay, queue, hops
+
+    def save(self, path):
+        # A temp file of its own per writer, so concurrent saves of the same graph never share one
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, indptr=self.indptr, indices=self.indices, sol_delays=self.sol_delays,
+                         speeds=self.speeds, uplinks=self.uplinks)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['indptr'], data['indices'], data['sol_delays'], data['speeds'], data['uplinks'])
+
+
+def legacy_random(node_count, rng, max_link_speeds):
+    # The simulator's original graph: every node in turn picks uniform(6, 12) neighbours by
+    # rejection sampling from the simulation RNG. Kept draw for draw so seeded runs reproduce.
+    nbr_sets = [set() for _ in range(node_count)]
+    src, dst, sol_delays, speeds = [], [], [], []
+    for node_id in range(node_count):
+        count = int(rng.uniform(6, 12))
+        if count > node_count - 1:
+            count = node_count - 1
+        count -= len(nbr_sets[node_id])
+
+        while count > 0:
+            nbr_id = int(rng.uniform(0, node_count))
+            if nbr_id == node_id or nbr_id in nbr_sets[node_id]:
+                continue
+            nbr_sets[node_id].add(nbr_id)
+            nbr_sets[nbr_id].add(node_id)
+            src.append(node_id)
+            dst.append(nbr_id)
+            sol_delays.append(int(rng.uniform(10, 501)))
+            speeds.append(min(max_link_speeds[node_id], max_link_speeds[nbr_id]))
+            count -= 1
+    return Topology.from_edges(node_count, src, dst, sol_delays, speeds, max_link_speeds)
+
+
+def simple_edges(node_count, src, dst):
+    # Drop self-loops and repeated edges, keeping the first occurrence of each
+    low = np.minimum(src, dst)
+    high = np.maximum(src, dst)
+    keep = low != high
+    low, high = low[keep], high[keep]
+    _, first = np.unique(low * node_count + high, return_index=True)
+    first.sort()
+    return low[first], high[first]
+
+
+def random_regular(node_count, degree, rng):
+    # Configuration model: pair up degree stubs per node at random. The few self-loops and
+    # repeated edges are dropped, so a handful of nodes end up one or two links short.
+    if node_count * degree % 2:
+        degree -= 1
+    stubs = rng.permutation(np.repeat(np.arange(node_count), degree))
+    return simple_edges(node_count, stubs[0::2], stubs[1::2])
+
+
+def erdos_renyi(node_count, degree, rng):
+    # G(n, p) with p chosen for the requested mean degree: a binomial number of distinct pairs,
+    # each pair index decoded to (i, j) with j < i
+    pairs = node_count * (node_count - 1) // 2
+    edge_count = rng.binomial(pairs, min(1.0, degree / max(1, node_count - 1)))
+    codes = rng.choice(pairs, size=edge_count, replace=False)
+    high = ((1 + np.sqrt(1 + 8 * codes.astype(np.float64))) / 2).astype(np.int64)
+    high -= high * (high - 1) // 2 > codes  # guard against float rounding up
+    low = codes - high * (high - 1) // 2
+    return low, high
+
+
+def scale_free(node_count, degree, rng):
+    # Barabasi-Albert preferential attachment with m = degree / 2 links per new node, grown
+    # from a clique of m + 1 nodes
+    m = max(1, degree // 2)
+    seed_count = min(node_count, m + 1)
+    src, dst = [], []
+    for a in range(seed_count):
+        for b in range(a):
+            src.append(a)
+            dst.append(b)
+    endpoints = src + dst  # every node appears once per link, so uniform picks are degree-weighted
+
+    for node_id in range(seed_count, node_count):
+        targets = set()
+        while len(targets) < m:
+            targets.add(endpoints[int(rng.integers(len(endpoints)))])
+        for target in targets:
+            src.append(node_id)
+            dst.append(target)
+            endpoints.append(node_id)
+            endpoints.append(target)
+    return np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64)
+
+
+def read_edge_list(path, node_count):
+    # One edge per line: "u v [sol_delay_ms [speed_mbps]]"; blank lines and # comments are skipped
+    src, dst, sol_delays, speeds = [], [], [], []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) < 2 or len(fields) > 4:
+                raise ValueError('{path}:{line}: expected "u v [sol_delay_ms [speed_mbps]]"'.format(
+                    path=path, line=line_number))
+            u, v = int(fields[0]), int(fields[1])
+            if not (0 <= u < node_count and 0 <= v < node_count) or u == v:
+                raise ValueError('{path}:{line}: bad edge {u} {v} for {n} nodes'.format(
+                    path=path, line=line_number, u=u, v=v, n=node_count))
+            src.append(u)
+            dst.append(v)
+            sol_delays.append(float(fields[2]) if len(fields) > 2 else np.nan)
+            speeds.append(float(fields[3]) * 1024 * 1024 if len(fields) > 3 else np.nan)
+    return (np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64),
+            np.array(sol_delays, dtype=np.float64), np.array(speeds, dtype=np.float64))
+
+
+def sample_sol_delays(model, node_count, src, dst, rng):
+    if model == 'geographic':
+        regions = rng.choice(len(REGIONS), size=node_count, p=REGION_SHARES)
+        jitter = rng.uniform(0, 10, size=len(src))
+        return np.maximum(MIN_SOL_DELAY, np.floor(REGION_LATENCY[regions[src], regions[dst]] + jitter))
+    return rng.integers(MIN_SOL_DELAY, MAX_SOL_DELAY + 1, size=len(src)).astype(np.float64)
+
+
+def sample_uplinks(node_count, rng):
+    # Each node gets a 5-100 Mbit/s uplink; a link runs at the slower of its two ends
+    return (rng.integers(5, 101, size=node_count) * 1024 * 1024).astype(np.float64)
+
+
+def generate(args):
+    # Generated topologies use their own RNG stream, so a cached topology gives the same run
+    # as a freshly generated one
+    rng = np.random.default_rng(None if args.seed is None else [args.seed, 0x70b0])
+    node_count = args.N
+    if args.topology == 'file':
+        src, dst, sol_delays, speeds = read_edge_list(args.topology_file, node_count)
+        missing = np.isnan(sol_delays)
+        sol_delays[missing] = sample_sol_delays(args.latency, node_count, src[missing], dst[missing], rng)
+        missing = np.isnan(speeds)
+        uplinks = sample_uplinks(node_count, rng)
+        speeds[missing] = np.minimum(uplinks[src[missing]], uplinks[dst[missing]])
+        return Topology.from_edges(node_count, src, dst, sol_delays, speeds, uplinks)
+
+    if args.topology == 'random_regular':
+        src, dst = random_regular(node_count, args.degree, rng)
+    elif args.topology == 'erdos_renyi':
+        src, dst = erdos_renyi(node_count, args.degree, rng)
+    else:
+        src, dst = scale_free(node_count, args.degree, rng)
+    sol_delays = sample_sol_delays(args.latency, node_count, src, dst, rng)
+    uplinks = sample_uplinks(node_count, rng)
+    return Topology.from_edges(node_count, src, dst, sol_delays, np.minimum(uplinks[src], uplinks[dst]), uplinks)
+
+
+def cache_key(args):
+    params = {'topology': args.topology, 'N': args.N, 'degree': args.degree, 'latency': args.latency,
+              'seed': args.seed, 'format': Topology.FORMAT}
+    if args.topology == 'file':
+        stat = os.stat(args.topology_file)
+        params.update(file=os.path.abspath(args.topology_file), size=stat.st_size, mtime=stat.st_mtime_ns)
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+    return '{topology}_N_{N}_{digest}.npz'.format(topology=args.topology, N=args.N, digest=digest)
+
+
+def build_topology(args, rng, max_link_speeds):
+    if args.topology == 'random':
+        return legacy_random(args.N, rng, max_link_speeds)
+
+    cache_path = None
+    if args.topology_cache is not None and (args.seed is not None or args.topology == 'file'):
+        os.makedirs(args.topology_cache, exist_ok=True)
+        cache_path = os.path.join(args.topology_cache, cache_key(args))
+        if os.path.exists(cache_path):
+            return Topology.load(cache_path)
+
+    topology = generate(args)
+    if cache_path is not None:
+        try:
+            topology.save(cache_path)
+        except OSError:
+            if not os.path.exists(cache_path):  # another worker cached the same graph first
+                raise
+    return topology
@@ -0,0 +1,33 @@
+import argparse
+import sys
+
+import numpy as np
+
+from mtp2_final import LOG_LEVELS, TRACE_DTYPE, TRACE_LEVELS, format_trace_record
+
+CHUNK_RECORDS = 1 << 16
+
+
+def read_trace(path, node=None, level='debug'):
+    records = np.memmap(path, dtype=TRACE_DTYPE, mode='r')
+    max_level = LOG_LEVELS[level]
+    for start in range(0, len(records), CHUNK_RECORDS):
+        chunk = records[start:start + CHUNK_RECORDS]
+        if node is not None:
+            chunk = chunk[chunk['node'] == node]
+        for time, node_id, kind, block_id, aux1, aux2 in chunk.tolist():
+            if TRACE_LEVELS[kind] <= max_level:
+                yield format_trace_record(time, node_id, kind, block_id, aux1, aux2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Reconstruct the human-readable event log from a binary trace')
+    parser.add_argument('trace', help='Trace file written with mtp2_final.py --trace')
+    parser.add_argument('--node', help='Only show events of this node', default=None, type=int)
+    parser.add_argument('--log_level', help='Verbosity of the reconstructed log', default='debug',
+                        choices=[level for level in LOG_LEVELS if level != 'off'])
+
+    args = parser.parse_args()
+    out = sys.stdout
+    for line in read_trace(args.trace, args.node, args.log_level):
+        out.write(line + '\n')